@@ -6,12 +6,21 @@
 
 import dash
 from dash import dcc, html, callback_context
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import copy
+import functools
 import json
+import threading
 
 import plotting as plot
 import calculations as calc
+import cache
+import equilibrium
+import lookup
+import metrics
+import phase
+import progressive
+import tipping
 
 
 # Dashboard preliminaries:
@@ -19,29 +28,107 @@ es = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
 app = dash.Dash(__name__, external_stylesheets=es)
 
+
+def cache_gauges():
+    # result cache statistics, for the metrics endpoint
+    return {
+        "daisyworld_cache_" + key: ("Result cache " + key + ".", value)
+        for key, value in cache.results.stats().items()
+    }
+
+
+# opt-in timing of callbacks and solves (DAISYWORLD_METRICS=1), served at
+# /metrics and logged
+metrics.instrument(
+    app.server, ("/_dash-update-component", "/_dash-layout"), cache_gauges
+)
+
 # Load any markdown files to insert into the app:
-instructions = open("./assets/instructions.md", "r")
-instructions_md = instructions.read()
+with open("./assets/instructions.md", "r") as instructions:
+    instructions_md = instructions.read()
 
-attributions = open("./assets/attributions.md", "r")
-attributions_md = attributions.read()
+with open("./assets/attributions.md", "r") as attributions:
+    attributions_md = attributions.read()
 
 # Load the dictionary of initial parameters:
 with open("init_vars.json") as infile:
     init_vars = json.load(infile)
 
-# Deepcopy of init_vars for callbacks:
-live_vars = copy.deepcopy(init_vars)
+# Precomputed Tab 2 slider-grid table (built with `python lookup.py build`), if any:
+equi_flux_table = lookup.load_table("./tables", "equi_flux")
 
-# Function calls for initializing figures:
-constant_flux_temp = plot.constant_flux_temp(
-    **init_vars,
-)
-constant_flux_area = plot.constant_flux_area(
-    **init_vars,
+
+# Tab 2 shows the forward and barren passes, and solves the backward one for
+# the hysteresis of its tipping points, on adaptive flux steps (as the table
+# of lookup.py holds them, lookup.EQUI_FLUX_OPTIONS)
+tab2_options = {"passes": ("forward", "barren", "backward"), "adaptive": True}
+# the tipping points are bisected from the sweeps of Tab 2 with the same
+# time-stepping, so that they mark the jumps of the curves drawn
+tipping_solver = equilibrium.EquilibriumSolver("fixed_point")
+
+# Tab 3 runs the gridded model on 4 degree cells; heat spreads over this many
+# degrees per generation until the slider is moved
+tab3_options = {"shape": (45, 90), "ngen": 60}
+tab3_diffusion = 10
+
+# Tab 4 maps which daisies survive over black daisy albedo and solar flux; the
+# tiles of every diagram solved are kept on disk, shared by all workers
+phase_axes = ["Ab", "F"]
+phase_tiles = "./phase_tiles"
+
+# the "Show uncertainty" switches of Tabs 1 and 2 run ensembles of this many
+# planets with perturbed daisy parameters (see ensemble.py)
+ensemble_size = 1000
+# the equilibrium search of the Tab 2 ensemble stops after this many
+# generations per flux step: planets which settle do so well within it, while
+# planets on a limit cycle (e.g. white daisies of albedo 1) would each run to
+# calc.EQUI_MAX_ITER, holding a worker for many seconds
+ensemble_max_iter = 100
+uncertainty_label = (
+    " Show uncertainty (%d planets with perturbed daisies)" % ensemble_size
 )
-varying_solar_flux_temp = plot.varying_solar_flux_temp(**init_vars)
-varying_solar_flux_area = plot.varying_solar_flux_area(**init_vars)
+
+# background Tab 2 sweeps and their partial results, shared by all workers
+jobs = progressive.JobStore("./jobs")
+
+
+def solve(table, solver, params, **options):
+    # use the precomputed table where possible (if it holds sweeps of the same
+    # options) and the (cached) solver otherwise
+    result = table.lookup(params, **options) if table is not None else None
+    if result is None:
+        result = solver(**params, **options)
+    return result
+
+
+# The figures are only built once, for the layout; the callbacks below just
+# send new trace data to the browser. Nothing is solved at import: the initial
+# figures are made on the first page load (one solve per experiment, which
+# also warms the cache for the callbacks that fire right after) and reused.
+initial_figures_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def initial_figures():
+    constant_flux = cache.solve_constant_flux(**init_vars)
+    varying_solar_flux = solve(
+        equi_flux_table, cache.solve_equi_flux, init_vars, **tab2_options
+    )
+    spatial = cache.solve_spatial(**init_vars, diffusion=tab3_diffusion, **tab3_options)
+    diagram = phase.solve_phase_diagram(phase_tiles, dict(init_vars, axes=phase_axes))
+    return {
+        "constant_flux_temp": plot.constant_flux_temp(constant_flux),
+        "constant_flux_area": plot.constant_flux_area(constant_flux),
+        "varying_solar_flux_temp": plot.varying_solar_flux_temp(varying_solar_flux),
+        "varying_solar_flux_area": plot.varying_solar_flux_area(varying_solar_flux),
+        # the ensembles are only solved once switched on
+        "constant_flux_ensemble": plot.constant_flux_ensemble(),
+        "varying_solar_flux_ensemble": plot.varying_solar_flux_ensemble(),
+        "spatial_temp": plot.spatial_temp(spatial),
+        "spatial_area": plot.spatial_area(spatial),
+        "phase_species": plot.phase_species(diagram),
+        "phase_temp": plot.phase_temp(diagram),
+    }
 
 
 # Make a dictionary for slider_style for convenience
@@ -51,8 +138,8 @@ slider_style = {
     "horizontal-align": "top",
 }
 
-# Main event:
-app.layout = html.Div(
+# Main event (the graphs get their figures in serve_layout):
+layout = html.Div(
     [
         html.Div(
             [
@@ -183,6 +270,23 @@ app.layout = html.Div(
                             ],
                             style={"width": "100%", "display": "inline-block"},
                         ),
+                        html.Div(
+                            [
+                                dcc.Checklist(
+                                    id="ensemble_1",
+                                    options=[
+                                        {"label": uncertainty_label, "value": "on"}
+                                    ],
+                                    value=[],
+                                ),
+                                html.Div(
+                                    [dcc.Graph(id="constant_flux_ensemble")],
+                                    id="ensemble_box_1",
+                                    style={"display": "none"},
+                                ),
+                            ],
+                            style={"width": "100%", "display": "inline-block"},
+                        ),
                     ],
                 ),
                 dcc.Tab(
@@ -265,6 +369,194 @@ app.layout = html.Div(
                                 html.Button("Reset", id="reset_button_2", n_clicks=0),
                                 dcc.Graph(id="varying_solar_flux_area"),
                                 dcc.Graph(id="varying_solar_flux_temp"),
+                                dcc.Markdown(id="tipping_summary"),
+                            ],
+                            style={"width": "100%", "display": "inline-block"},
+                        ),
+                        html.Div(
+                            [
+                                dcc.Checklist(
+                                    id="ensemble_2",
+                                    options=[
+                                        {"label": uncertainty_label, "value": "on"}
+                                    ],
+                                    value=[],
+                                ),
+                                html.Div(
+                                    [dcc.Graph(id="varying_solar_flux_ensemble")],
+                                    id="ensemble_box_2",
+                                    style={"display": "none"},
+                                ),
+                            ],
+                            style={"width": "100%", "display": "inline-block"},
+                        ),
+                    ],
+                ),
+                dcc.Tab(
+                    label="Spatial",
+                    children=[
+                        html.Div(
+                            [
+                                html.Div(
+                                    [
+                                        dcc.Markdown(""" White daisy albedo:"""),
+                                        dcc.Slider(
+                                            id="Aw_3",
+                                            min=0.5,
+                                            max=1,
+                                            step=0.05,
+                                            value=init_vars["Albedo"]["w"],
+                                            marks={0.5: "0.5", 1: "1"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topLeft",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown(""" Black daisy albedo: """),
+                                        dcc.Slider(
+                                            id="Ab_3",
+                                            min=0,
+                                            max=0.5,
+                                            step=0.05,
+                                            value=init_vars["Albedo"]["b"],
+                                            marks={0: "0", 0.5: "0.5"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topLeft",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown(""" Soil albedo """),
+                                        dcc.Slider(
+                                            id="Ap_3",
+                                            min=0.3,
+                                            max=0.7,
+                                            step=0.01,
+                                            value=init_vars["Albedo"]["none"],
+                                            marks={0.3: "0.3", 0.7: "0.7"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topLeft",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown("""Insulation factor"""),
+                                        dcc.Slider(
+                                            id="ins_3",
+                                            min=0,
+                                            max=0.5,
+                                            step=0.05,
+                                            value=init_vars["ins_p"],
+                                            marks={0: "0", 0.5: "0.5"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topRight",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown("""Heat transport (deg)"""),
+                                        dcc.Slider(
+                                            id="diffusion_3",
+                                            min=0,
+                                            max=30,
+                                            step=1,
+                                            value=tab3_diffusion,
+                                            marks={0: "0", 30: "30"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topRight",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Button("Reset", id="reset_button_3", n_clicks=0),
+                                dcc.Graph(id="spatial_temp"),
+                                dcc.Graph(id="spatial_area"),
+                            ],
+                            style={"width": "100%", "display": "inline-block"},
+                        ),
+                    ],
+                ),
+                dcc.Tab(
+                    label="Phase diagram",
+                    children=[
+                        html.Div(
+                            [
+                                html.Div(
+                                    [
+                                        dcc.Markdown(""" White daisy albedo:"""),
+                                        dcc.Slider(
+                                            id="Aw_4",
+                                            min=0.5,
+                                            max=1,
+                                            step=0.05,
+                                            value=init_vars["Albedo"]["w"],
+                                            marks={0.5: "0.5", 1: "1"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topLeft",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown(""" Soil albedo """),
+                                        dcc.Slider(
+                                            id="Ap_4",
+                                            min=0.3,
+                                            max=0.7,
+                                            step=0.01,
+                                            value=init_vars["Albedo"]["none"],
+                                            marks={0.3: "0.3", 0.7: "0.7"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topLeft",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Div(
+                                    [
+                                        dcc.Markdown("""Insulation factor"""),
+                                        dcc.Slider(
+                                            id="ins_4",
+                                            min=0,
+                                            max=0.5,
+                                            step=0.05,
+                                            value=init_vars["ins_p"],
+                                            marks={0: "0", 0.5: "0.5"},
+                                            tooltip={
+                                                "always_visible": True,
+                                                "placement": "topRight",
+                                            },
+                                        ),
+                                    ],
+                                    style=slider_style,
+                                ),
+                                html.Button("Reset", id="reset_button_4", n_clicks=0),
+                                dcc.Graph(id="phase_species"),
+                                dcc.Graph(id="phase_temp"),
                             ],
                             style={"width": "100%", "display": "inline-block"},
                         ),
@@ -286,67 +578,105 @@ app.layout = html.Div(
                 "margin-left": 20,
             },
         ),
-        dcc.Store(id="tab1_vars", data={}, storage_type="memory"),
+        dcc.Store(id="init_vars", data=init_vars, storage_type="memory"),
+        dcc.Store(id="tab1_ensemble_vars", data=None, storage_type="memory"),
         dcc.Store(id="tab2_vars", data={}, storage_type="memory"),
+        dcc.Interval(id="tab2_poll", interval=250, disabled=True),
     ],
     style={"width": "1000px"},
 )
 
+
+def serve_layout():
+    # called by Dash on every page load
+    with initial_figures_lock:
+        figures = initial_figures()
+    for graph_id, figure in figures.items():
+        layout[graph_id].figure = figure
+    return layout
+
+
+# the static layout is enough to check the callbacks against; setting it first
+# also keeps Dash from calling serve_layout (and solving) at import
+app.validation_layout = layout
+app.layout = serve_layout
+
 #####################################################################
 # Tab 1 Callbacks
 #####################################################################
-# update memory .json live_vars (dcc.Store(id='tab1_vars)')
-@app.callback(
-    Output(component_id="tab1_vars", component_property="data"),
+# Tab 1 runs entirely in the browser: the constant flux model is ported to
+# assets/daisyworld.js (keep it in step with calculations.py), so moving a
+# slider recomputes the figures without calling the server.
+app.clientside_callback(
+    ClientsideFunction(namespace="daisyworld", function_name="update_tab1"),
+    Output(component_id="constant_flux_temp", component_property="extendData"),
+    Output(component_id="constant_flux_area", component_property="extendData"),
     Input(component_id="Aw_1", component_property="value"),
     Input(component_id="Ab_1", component_property="value"),
     Input(component_id="Ap_1", component_property="value"),
     Input(component_id="ins_1", component_property="value"),
     Input(component_id="distance", component_property="value"),
+    State("init_vars", "data"),
 )
-def update_tab1_vars(Aw_1, Ab_1, Ap_1, ins_1, distance):
-    live_vars["Albedo"]["w"] = Aw_1
-    live_vars["Albedo"]["b"] = Ab_1
-    live_vars["Albedo"]["none"] = Ap_1
-    live_vars["ins_p"] = ins_1
-    live_vars["Fsnom"] = calc.update_solar_constant(calc.fromAU(distance))
-    return json.dumps(live_vars)  # return a json dict
-
-
-# update figure using the jsonified tab1_vars:
-@app.callback(
-    Output(component_id="constant_flux_temp", component_property="figure"),
-    Output(component_id="constant_flux_area", component_property="figure"),
-    Input("tab1_vars", "data"),
-)
-def update_tab1(jsonified_tab1_vars):
-    the_dict = json.loads(jsonified_tab1_vars)
-    return plot.constant_flux_temp(**the_dict), plot.constant_flux_area(**the_dict)
 
 
 # reset sliders on button input:
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="daisyworld", function_name="reset_tab1"),
     Output("Aw_1", "value"),
     Output("Ab_1", "value"),
     Output("Ap_1", "value"),
     Output("ins_1", "value"),
     Output("distance", "value"),
     Input("reset_button", "n_clicks"),
+    State("init_vars", "data"),
 )
-def reset_tab1(n_clicks):
-    return (
-        init_vars["Albedo"]["w"],
-        init_vars["Albedo"]["b"],
-        init_vars["Albedo"]["none"],
-        init_vars["ins_p"],
-        1,
-    )
+
+
+# the ensemble runs on the server: percentile bands of the constant flux
+# experiment over ensemble_size perturbed planets. The sliders are passed on
+# (to tab1_ensemble_vars) in the browser, and only while it is switched on.
+app.clientside_callback(
+    ClientsideFunction(namespace="daisyworld", function_name="gate_tab1_ensemble"),
+    Output("tab1_ensemble_vars", "data"),
+    Output("ensemble_box_1", "style"),
+    Input("ensemble_1", "value"),
+    Input("Aw_1", "value"),
+    Input("Ab_1", "value"),
+    Input("Ap_1", "value"),
+    Input("ins_1", "value"),
+    Input("distance", "value"),
+)
+
+
+@app.callback(
+    Output(component_id="constant_flux_ensemble", component_property="extendData"),
+    Input("tab1_ensemble_vars", "data"),
+)
+def update_tab1_ensemble(sliders):
+    metrics.label("update_tab1_ensemble")
+    if not sliders:
+        return dash.no_update
+    tab1_vars = copy.deepcopy(init_vars)
+    tab1_vars["Albedo"]["w"] = sliders["Aw"]
+    tab1_vars["Albedo"]["b"] = sliders["Ab"]
+    tab1_vars["Albedo"]["none"] = sliders["An"]
+    tab1_vars["ins_p"] = sliders["ins_p"]
+    tab1_vars["Fsnom"] = calc.update_solar_constant(calc.fromAU(sliders["distance"]))
+    metrics.note(**metrics.params_fields(tab1_vars))
+    with metrics.stage("solve"):
+        result = cache.solve_constant_flux_ensemble(**tab1_vars, size=ensemble_size)
+    with metrics.stage("traces"):
+        traces = plot.trace_update(plot.constant_flux_ensemble_traces(result))
+    return traces
 
 
 #####################################################################
 # Tab 2 Callbacks
 #####################################################################
-# update memory .json live_vars (dcc.Store(id='tab2_vars)')
+# update the parameter dict in memory (dcc.Store(id='tab2_vars)'). The
+# parameters are rebuilt from init_vars on every call, so no state is shared
+# between sessions (or threads and workers serving them).
 @app.callback(
     Output(component_id="tab2_vars", component_property="data"),
     Input(component_id="Aw_2", component_property="value"),
@@ -355,24 +685,89 @@ def reset_tab1(n_clicks):
     Input(component_id="ins_2", component_property="value"),
 )
 def update_tab2_vars(Aw_2, Ab_2, Ap_2, ins_2):
-    live_vars["Albedo"]["w"] = Aw_2
-    live_vars["Albedo"]["b"] = Ab_2
-    live_vars["Albedo"]["none"] = Ap_2
-    live_vars["ins_p"] = ins_2
-    return json.dumps(live_vars)  # return a json dict
+    metrics.label("update_tab2_vars")
+    tab2_vars = copy.deepcopy(init_vars)
+    tab2_vars["Albedo"]["w"] = Aw_2
+    tab2_vars["Albedo"]["b"] = Ab_2
+    tab2_vars["Albedo"]["none"] = Ap_2
+    tab2_vars["ins_p"] = ins_2
+    return tab2_vars  # the store serializes the dict itself
 
 
-# update the figures using the jsonified tab2_vars:
+# update the figures' trace data using the tab2_vars parameter dict. A sweep
+# which is neither precomputed nor cached is solved right away if small (as
+# Tab 2's are, see progressive.py), or else in the background: its partial
+# curves are drawn as they come in, polling (tab2_poll) until done (or
+# failed). Once done, the tipping points are marked and summarized.
 @app.callback(
-    Output(component_id="varying_solar_flux_temp", component_property="figure"),
-    Output(component_id="varying_solar_flux_area", component_property="figure"),
+    Output(component_id="varying_solar_flux_temp", component_property="extendData"),
+    Output(component_id="varying_solar_flux_area", component_property="extendData"),
+    Output(component_id="tab2_poll", component_property="disabled"),
+    Output(component_id="tipping_summary", component_property="children"),
     Input("tab2_vars", "data"),
+    Input("tab2_poll", "n_intervals"),
 )
-def update_tab2(jsonified_tab2_vars):
-    the_dict = json.loads(jsonified_tab2_vars)
-    return plot.varying_solar_flux_temp(**the_dict), plot.varying_solar_flux_area(
-        **the_dict
-    )
+def update_tab2(the_dict, n_intervals):
+    metrics.label("update_tab2")
+    metrics.note(**metrics.params_fields(the_dict))
+    with metrics.stage("lookup"):
+        result = None
+        if equi_flux_table is not None:
+            result = equi_flux_table.lookup(the_dict, **tab2_options)
+    done = True
+    if result is None:
+        with metrics.stage("solve"):
+            params = dict(the_dict, **tab2_options)
+            try:
+                result, done = progressive.solve_equi_flux(jobs, params)
+            except progressive.JobFailed as error:
+                # stop polling, and keep the curves drawn so far
+                metrics.note(error=str(error))
+                summary = "The sweep failed: %s" % error
+                return dash.no_update, dash.no_update, True, summary
+    metrics.note(done=done)
+    if result is None:
+        # nothing to draw yet
+        return dash.no_update, dash.no_update, False, ""
+    summary = ""
+    markers = ([], [])
+    if done:
+        points = cache.find_tipping_points(
+            result, tipping_solver, tab2_options, **the_dict
+        )
+        summary = tipping.describe(points)
+        markers = plot.tipping_traces(points)
+    # replace the traces of both figures; their layout stays as built at startup
+    with metrics.stage("traces"):
+        temp = plot.trace_update(plot.varying_solar_flux_temp_traces(result))
+        temp = plot.append_trace(temp, markers)
+        area = plot.trace_update(plot.varying_solar_flux_area_traces(result))
+    return temp, area, done, summary
+
+
+# percentile bands of the forward and barren sweeps over ensemble_size
+# perturbed planets, while switched on, with the shorter equilibrium search
+@app.callback(
+    Output(component_id="varying_solar_flux_ensemble", component_property="extendData"),
+    Output(component_id="ensemble_box_2", component_property="style"),
+    Input(component_id="ensemble_2", component_property="value"),
+    Input("tab2_vars", "data"),
+)
+def update_tab2_ensemble(show, the_dict):
+    metrics.label("update_tab2_ensemble")
+    if not show or not the_dict:
+        return dash.no_update, {"display": "none"}
+    metrics.note(**metrics.params_fields(the_dict))
+    with metrics.stage("solve"):
+        result = cache.solve_equi_flux_ensemble(
+            **the_dict,
+            size=ensemble_size,
+            passes=("forward", "barren"),
+            max_iter=ensemble_max_iter,
+        )
+    with metrics.stage("traces"):
+        traces = plot.trace_update(plot.varying_solar_flux_ensemble_traces(result))
+    return traces, {"display": "block"}
 
 
 # Reset sliders on button input:
@@ -392,5 +787,97 @@ def reset_tab2(n_clicks):
     )
 
 
+#####################################################################
+# Tab 3 Callbacks
+#####################################################################
+# run the gridded model (cached) and replace the values of both heatmaps
+@app.callback(
+    Output(component_id="spatial_temp", component_property="extendData"),
+    Output(component_id="spatial_area", component_property="extendData"),
+    Input(component_id="Aw_3", component_property="value"),
+    Input(component_id="Ab_3", component_property="value"),
+    Input(component_id="Ap_3", component_property="value"),
+    Input(component_id="ins_3", component_property="value"),
+    Input(component_id="diffusion_3", component_property="value"),
+)
+def update_tab3(Aw_3, Ab_3, Ap_3, ins_3, diffusion_3):
+    metrics.label("update_tab3")
+    tab3_vars = copy.deepcopy(init_vars)
+    tab3_vars["Albedo"]["w"] = Aw_3
+    tab3_vars["Albedo"]["b"] = Ab_3
+    tab3_vars["Albedo"]["none"] = Ap_3
+    tab3_vars["ins_p"] = ins_3
+    metrics.note(**metrics.params_fields(tab3_vars), diffusion=diffusion_3)
+    with metrics.stage("solve"):
+        result = cache.solve_spatial(**tab3_vars, diffusion=diffusion_3, **tab3_options)
+    with metrics.stage("traces"):
+        temp = plot.heatmap_update(plot.spatial_temp_traces(result))
+        area = plot.heatmap_update(plot.spatial_area_traces(result))
+    return temp, area
+
+
+# Reset sliders on button input:
+@app.callback(
+    Output("Aw_3", "value"),
+    Output("Ab_3", "value"),
+    Output("Ap_3", "value"),
+    Output("ins_3", "value"),
+    Output("diffusion_3", "value"),
+    Input("reset_button_3", "n_clicks"),
+)
+def reset_tab3(n_clicks):
+    return (
+        init_vars["Albedo"]["w"],
+        init_vars["Albedo"]["b"],
+        init_vars["Albedo"]["none"],
+        init_vars["ins_p"],
+        tab3_diffusion,
+    )
+
+
+#####################################################################
+# Tab 4 Callbacks
+#####################################################################
+# solve the phase diagram (cached, and tiled on disk) and replace the values
+# of both heatmaps
+@app.callback(
+    Output(component_id="phase_species", component_property="extendData"),
+    Output(component_id="phase_temp", component_property="extendData"),
+    Input(component_id="Aw_4", component_property="value"),
+    Input(component_id="Ap_4", component_property="value"),
+    Input(component_id="ins_4", component_property="value"),
+)
+def update_tab4(Aw_4, Ap_4, ins_4):
+    metrics.label("update_tab4")
+    tab4_vars = copy.deepcopy(init_vars)
+    tab4_vars["Albedo"]["w"] = Aw_4
+    tab4_vars["Albedo"]["none"] = Ap_4
+    tab4_vars["ins_p"] = ins_4
+    metrics.note(**metrics.params_fields(tab4_vars))
+    with metrics.stage("solve"):
+        diagram = phase.solve_phase_diagram(
+            phase_tiles, dict(tab4_vars, axes=phase_axes)
+        )
+    with metrics.stage("traces"):
+        species = plot.heatmap_update(plot.phase_species_traces(diagram))
+        temp = plot.heatmap_update(plot.phase_temp_traces(diagram))
+    return species, temp
+
+
+# Reset sliders on button input:
+@app.callback(
+    Output("Aw_4", "value"),
+    Output("Ap_4", "value"),
+    Output("ins_4", "value"),
+    Input("reset_button_4", "n_clicks"),
+)
+def reset_tab4(n_clicks):
+    return (
+        init_vars["Albedo"]["w"],
+        init_vars["Albedo"]["none"],
+        init_vars["ins_p"],
+    )
+
+
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -0,0 +1,183 @@
+// file daisyworld.js
+
+// Browser port of the constant flux experiment of calculations.py, so that the
+// sliders of tab 1 recompute the figures without a round trip to the server.
+// The functions mirror their Python namesakes line by line (same operations in
+// the same order); keep the two in step when changing the model.
+// Dash serves every .js file in assets/ with the page; under node the
+// functions are exported instead, for comparing against the Python results.
+
+var daisyworld = (function () {
+    // names of the entries of the state vector, as calc.STATE_VARS
+    var STATE_VARS = ["Sw", "Sb", "Su", "Ap", "Tp", "Tw", "Tb"];
+    var NGEN = 40;
+
+    function UpdateAlbedo(x, Albedo) {
+        // weighted sum of different planet cover
+        x.Ap = Albedo.none * x.Su + Albedo.w * x.Sw + Albedo.b * x.Sb;
+        return x;
+    }
+
+    function UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo) {
+        // outward flux of a planet with the average albedo (assume Black body)
+        var Fp = (F * (1 - x.Ap) * rat) / em_p;
+        // invert Stefan Boltzmann's law
+        x.Tp = Math.sqrt(Math.sqrt(Fp / sig));
+        // now do the same for the regions with white and black daisies
+        var Fw = (F * (1 - Albedo.w) * rat) / em_p;
+        x.Tw = Math.sqrt(Math.sqrt((ins_p * (Fw - Fp) + Fp) / sig));
+        var Fb = (F * (1 - Albedo.b) * rat) / em_p;
+        x.Tb = Math.sqrt(Math.sqrt((ins_p * (Fb - Fp) + Fp) / sig));
+        return x;
+    }
+
+    function DaisyGrowth(T, bwtype, T_min, T_opt) {
+        var Gw =
+            1 -
+            Math.pow((T - T_opt[bwtype]) / (T_min[bwtype] - T_opt[bwtype]), 2);
+        // set negative values to 0
+        return Gw < 0 ? 0 : Gw;
+    }
+
+    function UpdateAreas(x, death, minarea, T_min, T_opt) {
+        ["w", "b"].forEach(function (Stype) {
+            var grwth = DaisyGrowth(x["T" + Stype], Stype, T_min, T_opt);
+            var ArType = "S" + Stype;
+            var Ds = x[ArType] * (grwth * x.Su - death[Stype]);
+            // keep the area at zero if it has been set to exactly zero and
+            // apply the minimum area if the area comes below the threshold
+            if (x[ArType] > 0) {
+                x[ArType] += Ds;
+                if (x[ArType] < minarea) {
+                    x[ArType] = minarea;
+                }
+            }
+        });
+        // update barren area (that what is left)
+        x.Su = 1 - x.Sw - x.Sb;
+    }
+
+    function StepState(x, F, p) {
+        // advance the state vector x by one generation, in place
+        UpdateTemp(x, F, p.rat, p.em_p, p.sig, p.ins_p, p.Albedo);
+        UpdateAreas(x, p.death, p.minarea, p.T_min, p.T_opt);
+        UpdateAlbedo(x, p.Albedo);
+    }
+
+    function update_constant_flux(p, areas) {
+        // as calc.update_constant_flux for the parameter object p (the keys of
+        // init_vars.json); returns {state name: [value per generation]}
+        var F = p.Fsnom * 1;
+        var x = { Sw: areas.w, Sb: areas.b };
+        x.Su = 1 - x.Sw - x.Sb;
+        UpdateAlbedo(x, p.Albedo);
+        UpdateTemp(x, F, p.rat, p.em_p, p.sig, p.ins_p, p.Albedo);
+
+        var xgens = {};
+        STATE_VARS.forEach(function (name) {
+            xgens[name] = new Array(NGEN);
+            xgens[name][0] = x[name];
+        });
+        for (var g = 1; g < NGEN; g++) {
+            StepState(x, F, p);
+            STATE_VARS.forEach(function (name) {
+                xgens[name][g] = x[name];
+            });
+        }
+        return xgens;
+    }
+
+    function update_solar_constant(solar_distance) {
+        var luminosity = 10e26;
+        // nominal flux in W/m^2
+        return luminosity / (4 * Math.PI * Math.pow(solar_distance, 2));
+    }
+
+    function fromAU(distance) {
+        return distance * 1.496e11;
+    }
+
+    function trace_update(x, ys) {
+        // extendData replacing all traces of a figure, as plot.trace_update
+        return [
+            { x: ys.map(function () { return x; }), y: ys },
+            ys.map(function (_, i) { return i; }),
+            x.length,
+        ];
+    }
+
+    function update_tab1(Aw, Ab, An, ins_p, distance, init_vars) {
+        // the slider callback of tab 1: solve and replace the traces of the
+        // constant_flux_temp and constant_flux_area figures
+        var p = Object.assign({}, init_vars, {
+            Albedo: Object.assign({}, init_vars.Albedo, { w: Aw, b: Ab, none: An }),
+            ins_p: ins_p,
+            Fsnom: update_solar_constant(fromAU(distance)),
+        });
+        var xgens = update_constant_flux(p, { w: 0.01, b: 0.01 });
+        var gens = xgens.Sw.map(function (_, i) { return i; });
+        var celsius = function (T) { return T - 273.15; };
+        var percent = function (S) { return 100 * S; };
+        return [
+            trace_update(gens, [
+                xgens.Tw.map(celsius),
+                xgens.Tb.map(celsius),
+                xgens.Tp.map(celsius),
+            ]),
+            trace_update(gens, [
+                xgens.Sw.map(percent),
+                xgens.Sb.map(percent),
+                xgens.Su.map(percent),
+                xgens.Ap,
+            ]),
+        ];
+    }
+
+    function reset_tab1(n_clicks, init_vars) {
+        // slider values of tab 1 for the initial parameters
+        return [
+            init_vars.Albedo.w,
+            init_vars.Albedo.b,
+            init_vars.Albedo.none,
+            init_vars.ins_p,
+            1,
+        ];
+    }
+
+    function gate_tab1_ensemble(show, Aw, Ab, An, ins_p, distance) {
+        // the sliders of tab 1 for its ensemble (solved on the server) and the
+        // style of the ensemble box: the sliders only go to the server while
+        // the ensemble is switched on
+        if (!show || !show.length) {
+            return [window.dash_clientside.no_update, { display: "none" }];
+        }
+        return [
+            { Aw: Aw, Ab: Ab, An: An, ins_p: ins_p, distance: distance },
+            { display: "block" },
+        ];
+    }
+
+    return {
+        STATE_VARS: STATE_VARS,
+        UpdateAlbedo: UpdateAlbedo,
+        UpdateTemp: UpdateTemp,
+        DaisyGrowth: DaisyGrowth,
+        UpdateAreas: UpdateAreas,
+        StepState: StepState,
+        update_constant_flux: update_constant_flux,
+        update_solar_constant: update_solar_constant,
+        fromAU: fromAU,
+        update_tab1: update_tab1,
+        reset_tab1: reset_tab1,
+        gate_tab1_ensemble: gate_tab1_ensemble,
+    };
+})();
+
+if (typeof window !== "undefined") {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        daisyworld: daisyworld,
+    });
+}
+if (typeof module !== "undefined") {
+    module.exports = daisyworld;
+}
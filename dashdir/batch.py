@@ -0,0 +1,201 @@
+# file batch.py
+
+# Batched version of the Daisyworld model in calculations.py: every parameter
+# (including the entries of the per-species dictionaries) may be an array of
+# shape (N,), and all N planets are stepped together with NumPy broadcasting.
+# The state of the N planets is a structured array of shape (N,) (see
+# calc.state_dtype), so calc.UpdateTemp and calc.UpdateAlbedo work on it
+# unchanged; only the branchy growth and area updates need masked versions.
+
+import numpy as np
+
+import calculations as calc
+
+
+def map_params(f, params):
+    # apply f to every leaf of a (possibly nested) parameter dictionary
+    if isinstance(params, dict):
+        return {key: map_params(f, value) for key, value in params.items()}
+    return f(params)
+
+
+def broadcast_params(**params):
+    # broadcast all parameters to one common shape (N,)
+    leaves = []
+    map_params(leaves.append, params)
+    shape = np.broadcast_shapes(*[np.shape(v) for v in leaves], (1,))
+    if len(shape) != 1:
+        raise ValueError("batched parameters must be scalars or arrays of shape (N,)")
+    params = map_params(
+        lambda v: np.broadcast_to(np.asarray(v, dtype=np.float64), shape), params
+    )
+    return params, shape[0]
+
+
+def take_params(params, idx):
+    # select the planets idx from a broadcast parameter dictionary
+    return map_params(lambda v: v[idx], params)
+
+
+def DaisyGrowth(T, bwtype, T_min, T_opt):
+    Gw = 1 - ((T - T_opt[bwtype]) / (T_min[bwtype] - T_opt[bwtype])) ** 2
+    # set negative values to 0
+    return np.where(Gw < 0, 0.0, Gw)
+
+
+# function to update areas based on growth rate and death rate
+def UpdateAreas(x, death, minarea, T_min, T_opt):
+
+    for Stype in ["w", "b"]:
+        grwth = DaisyGrowth(x["T" + Stype], Stype, T_min, T_opt)
+        ArType = "S" + Stype
+        Ds = x[ArType] * (grwth * x["Su"] - death[Stype])
+        # the same 2 checks as in calc.UpdateAreas, applied as masks:
+        # (1) areas which have been set to exactly zero stay zero
+        alive = x[ArType] > 0
+        area = np.where(alive, x[ArType] + Ds, x[ArType])
+        # (2) apply the minimum area if the area comes below the threshold
+        x[ArType] = np.where(alive & (area < minarea), minarea, area)
+
+    # update barren area (that what is left)
+    x["Su"] = 1 - x["Sw"] - x["Sb"]
+
+
+def StepStates(x, F, p):
+    # advance the states x of all planets by one generation, in place
+    calc.UpdateTemp(x, F, p["rat"], p["em_p"], p["sig"], p["ins_p"], p["Albedo"])
+    UpdateAreas(x, p["death"], p["minarea"], p["T_min"], p["T_opt"])
+    calc.UpdateAlbedo(x, p["Albedo"])
+
+
+def RelaxStates(x, F, p, tol=calc.EQUI_TOL, max_iter=calc.EQUI_MAX_ITER):
+    # batched calc.RelaxState: step every planet until its temperature changes
+    # by no more than tol K, or for at most max_iter generations. Converged
+    # planets are dropped from the working set, so each planet takes exactly
+    # the steps it would take on its own. Returns the generations stepped and
+    # the last temperature change of every planet.
+    active = np.arange(len(x))
+    iterations = np.zeros(len(x), dtype=int)
+    residuals = np.zeros(len(x))
+    xa, Fa, pa = x.copy(), F, p
+    it = 0
+    while active.size:
+        temp = xa["Tp"].copy()
+        StepStates(xa, Fa, pa)
+        it += 1
+        dT = np.abs(temp - xa["Tp"])
+        moving = dT > tol
+        if it >= max_iter:
+            moving[:] = False
+        if not moving.all():
+            done = active[~moving]
+            x[done] = xa[~moving]
+            iterations[done] = it
+            residuals[done] = dT[~moving]
+            active = active[moving]
+            xa, Fa, pa = xa[moving], Fa[moving], take_params(pa, moving)
+    return iterations, residuals
+
+
+def initial_states(F, p, areas):
+    # state vectors of N planets with initial daisy areas areas["w"], areas["b"]
+    x0 = calc.new_states(len(F))
+    x0["Sw"] = areas["w"]
+    x0["Sb"] = areas["b"]
+    x0["Su"] = 1 - x0["Sw"] - x0["Sb"]
+    # note that we also need to initiate the planetary Albedo
+    calc.UpdateAlbedo(x0, p["Albedo"])
+    # and the temperature
+    calc.UpdateTemp(x0, F, p["rat"], p["em_p"], p["sig"], p["ins_p"], p["Albedo"])
+    return x0
+
+
+def update_constant_flux_batch(
+    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas
+):
+    # batched calc.update_constant_flux; xgens has shape (ngen, N)
+    p, n = broadcast_params(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    F = p["Fsnom"] * 1  # solar radiation
+    x = initial_states(F, p, areas)
+
+    # loop over generations
+    ngen = 40
+
+    xgens = calc.new_states((ngen, n))
+    xgens[0] = x
+    for g in range(1, ngen):
+        StepStates(x, F, p)
+        xgens[g] = x
+
+    gens = [i for i in range(ngen)]
+
+    return xgens, gens
+
+
+def update_equi_flux_batch(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    tol=calc.EQUI_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+):
+    # batched calc.update_equi_flux; xeq, xeqbar and xeqinv have shape (nt, N)
+    p, n = broadcast_params(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    F = calc.flux_fractions()
+    nt = len(F)
+
+    # seeded and barren initial conditions
+    x = initial_states(F[0] * p["Fsnom"], p, {"w": 0.01, "b": 0.01})
+    xbar = initial_states(F[0] * p["Fsnom"], p, {"w": 0.0, "b": 0.0})
+
+    # loop over radiation variation
+    xeq = calc.new_states((nt, n))
+    xeqbar = calc.new_states((nt, n))
+    xeq[0] = x
+    xeqbar[0] = xbar
+    for i, Fr in enumerate(F[1:], 1):
+        RelaxStates(x, Fr * p["Fsnom"], p, tol, max_iter)
+        xeq[i] = x
+        RelaxStates(xbar, Fr * p["Fsnom"], p, tol, max_iter)
+        xeqbar[i] = xbar
+
+    # also run the experiment backwards
+    # (use the end value of the forward run as starting point). As in
+    # calc.update_equi_flux, xeqinv[i] is the equilibrium at F[i + 1] and the
+    # last entry is the end value of the forward run.
+    xeqinv = calc.new_states((nt, n))
+    xeqinv[-1] = x
+    for i in range(nt - 1, 0, -1):
+        RelaxStates(x, F[i] * p["Fsnom"], p, tol, max_iter)
+        xeqinv[i - 1] = x
+
+    return (xeq, xeqbar, xeqinv, F)
@@ -0,0 +1,327 @@
+# file benchmark.py
+
+# Benchmarks of the model hot paths, the figure builders and the app callbacks
+# (end to end, through Dash's test client), with stored baselines to catch
+# regressions. From this directory:
+#   python benchmark.py                         # run all cases
+#   python benchmark.py -k Equi_state           # only the matching cases
+#   python benchmark.py --save baseline.json    # store the timings
+#   python benchmark.py --compare baseline.json # flag cases which got slower
+#   python benchmark.py --backend numba         # with the fused kernel
+# Each timing is the best of a few repeats, per call. Baselines are only
+# comparable on the same machine and backend (stored as "_backend", which
+# notes when the fused kernel ran uncompiled for want of Numba); --compare
+# warns when the backends differ, and exits with status 1 if a case is more
+# than --threshold times slower than its baseline.
+
+import argparse
+import copy
+import json
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+import calculations as calc
+import ensemble
+import equilibrium
+import phase
+import spatial
+import species
+import tipping
+
+
+def with_params(init_vars, **changes):
+    # copy of init_vars with some entries changed, e.g. Albedo={"w": 0.95}
+    params = copy.deepcopy(init_vars)
+    for key, value in changes.items():
+        if isinstance(value, dict):
+            params[key].update(value)
+        else:
+            params[key] = value
+    return params
+
+
+def relax_args(params):
+    # the positional arguments of calc.Equi_state after x0 and F
+    return [
+        params[key]
+        for key in (
+            "rat",
+            "em_p",
+            "sig",
+            "ins_p",
+            "Albedo",
+            "death",
+            "minarea",
+            "T_min",
+            "T_opt",
+        )
+    ]
+
+
+def edge_cases(params, count=2):
+    # [(F, x0)] of the equilibria which take the forward sweep the most
+    # generations (next to the tipping points, where Equi_state is slowest),
+    # each with the equilibrium of the point before as starting state
+    result = calc.solve_equi_flux(**params, passes=("forward",))
+    slowest = np.argsort(result.iterations[0])[::-1][:count]
+    return [(result.F[i], result.xeq[i - 1]) for i in sorted(slowest)]
+
+
+def many_species(init_vars, n):
+    # parameters of n species with albedos spread between those of the black
+    # and the white daisies, sharing the same seed area of 0.02
+    params = species.species_params(**init_vars)
+    params["Albedo"] = np.linspace(
+        init_vars["Albedo"]["b"], init_vars["Albedo"]["w"], n
+    )
+    for key in ("death", "T_min", "T_opt"):
+        params[key] = np.full(n, params[key][0])
+    params["minarea"] = init_vars["minarea"] / n
+    return dict(params, areas=np.full(n, 0.02 / n))
+
+
+def model_cases(init_vars):
+    # {name: zero-argument callable} of the calculations hot paths
+    Fsnom = init_vars["Fsnom"]
+    args = relax_args(init_vars)
+    x = calc.as_dict(calc.solve_constant_flux(**init_vars).xgens[0])
+    cases = {
+        "NextState": lambda: calc.NextState(x, Fsnom, *args),
+    }
+    for F, x0 in edge_cases(init_vars):
+        cases["Equi_state (tipping point F=%.3f)" % F] = (
+            lambda F=F, x0=x0: calc.Equi_state(x0, F * Fsnom, *args)
+        )
+    # with white daisies this bright the sweep ends up on a limit cycle, and
+    # the equilibrium search runs into EQUI_MAX_ITER
+    cycling = with_params(init_vars, Albedo={"w": 0.95})
+    ((F, x0),) = edge_cases(cycling, 1)
+    cycling_args = relax_args(cycling)
+    cases["Equi_state (limit cycle Aw=0.95)"] = lambda: calc.Equi_state(
+        x0, F * Fsnom, *cycling_args
+    )
+    areas = {"w": 0.01, "b": 0.01}
+    cases["update_constant_flux"] = lambda: calc.update_constant_flux(
+        **init_vars, areas=areas
+    )
+    cases["update_equi_flux"] = lambda: calc.update_equi_flux(**init_vars)
+    cases["update_equi_flux (Aw=0.95)"] = lambda: calc.update_equi_flux(**cycling)
+    cases["spatial.solve_spatial (app grid)"] = lambda: spatial.solve_spatial(
+        **init_vars, diffusion=10
+    )
+    cases["spatial.solve_spatial (512x512, 10 generations)"] = (
+        lambda: spatial.solve_spatial(
+            **init_vars, diffusion=2, shape=(512, 512), ngen=10
+        )
+    )
+    cases["ensemble.solve_constant_flux_ensemble (1000 planets)"] = (
+        lambda: ensemble.solve_constant_flux_ensemble(**init_vars)
+    )
+    cases["ensemble.solve_equi_flux_ensemble (1000 planets)"] = (
+        lambda: ensemble.solve_equi_flux_ensemble(
+            **init_vars, passes=("forward", "barren")
+        )
+    )
+    two = species.species_params(**init_vars)
+    cases["species.update_constant_flux (2 species)"] = (
+        lambda: species.update_constant_flux(**two)
+    )
+    many = many_species(init_vars, 500)
+    cases["species.update_constant_flux (500 species)"] = (
+        lambda: species.update_constant_flux(**many)
+    )
+    cases["species.solve_equi_flux (500 species)"] = lambda: species.solve_equi_flux(
+        **many
+    )
+    cases["tipping.find_tipping_points"] = lambda: tipping.find_tipping_points(
+        **init_vars
+    )
+    cases["phase.phase_diagram (Ab x F, 5406 points)"] = lambda: phase.phase_diagram(
+        ["Ab", "F"], **init_vars
+    )
+    steady = equilibrium.EquilibriumSolver("steady_state")
+    cases["update_equi_flux (steady_state)"] = lambda: calc.update_equi_flux(
+        **init_vars, solver=steady
+    )
+    return cases
+
+
+def plotting_cases(init_vars):
+    # {name: zero-argument callable} of the figure builders
+    import plotting as plot
+
+    constant_flux = calc.solve_constant_flux(**init_vars)
+    equi_flux = calc.solve_equi_flux(**init_vars)
+    return {
+        "plot.constant_flux_temp": lambda: plot.constant_flux_temp(constant_flux),
+        "plot.constant_flux_area": lambda: plot.constant_flux_area(constant_flux),
+        "plot.varying_solar_flux_temp": lambda: plot.varying_solar_flux_temp(equi_flux),
+        "plot.varying_solar_flux_area": lambda: plot.varying_solar_flux_area(equi_flux),
+        "plot.trace_update (varying flux)": lambda: plot.trace_update(
+            plot.varying_solar_flux_temp_traces(equi_flux)
+        ),
+    }
+
+
+def callback_cases(init_vars, jobs_dir):
+    # {name: zero-argument callable} of Tab 2 requests through the test client
+    import app
+    import cache
+    import progressive
+
+    app.jobs = progressive.JobStore(jobs_dir)
+    client = app.app.server.test_client()
+    client.get("/")
+
+    def post(output, outputs, inputs):
+        response = client.post(
+            "/_dash-update-component",
+            json={
+                "output": output,
+                "outputs": outputs,
+                "inputs": inputs,
+                "changedPropIds": [inputs[0]["id"] + "." + inputs[0]["property"]],
+            },
+        )
+        return response.get_json()
+
+    sliders = [
+        {"id": slider, "property": "value", "value": value}
+        for slider, value in zip(
+            ("Aw_2", "Ab_2", "Ap_2", "ins_2"),
+            (
+                init_vars["Albedo"]["w"],
+                init_vars["Albedo"]["b"],
+                init_vars["Albedo"]["none"],
+                init_vars["ins_p"],
+            ),
+        )
+    ]
+    figures = [
+        {"id": "varying_solar_flux_temp", "property": "extendData"},
+        {"id": "varying_solar_flux_area", "property": "extendData"},
+        {"id": "tab2_poll", "property": "disabled"},
+        {"id": "tipping_summary", "property": "children"},
+    ]
+    figures_output = "..%s.." % "...".join(
+        "%s.%s" % (o["id"], o["property"]) for o in figures
+    )
+
+    def tab2_vars():
+        return post("tab2_vars.data", {"id": "tab2_vars", "property": "data"}, sliders)
+
+    params = tab2_vars()["response"]["tab2_vars"]["data"]
+
+    def update_tab2(n_intervals=0):
+        return post(
+            figures_output,
+            figures,
+            [
+                {"id": "tab2_vars", "property": "data", "value": params},
+                {"id": "tab2_poll", "property": "n_intervals", "value": n_intervals},
+            ],
+        )
+
+    def update_tab2_uncached():
+        # the whole progressive solve: the first request, then polls until done
+        cache.results.clear()
+        app.jobs = progressive.JobStore(tempfile.mkdtemp(dir=jobs_dir))
+        n = 0
+        while not update_tab2(n)["response"]["tab2_poll"]["disabled"]:
+            n += 1
+            time.sleep(0.005)
+
+    return {
+        "callback update_tab2_vars": tab2_vars,
+        "callback update_tab2 (cached)": update_tab2,
+        "callback update_tab2 (uncached, until done)": update_tab2_uncached,
+    }
+
+
+def backend_label():
+    # the backend calc.RelaxState runs on, noting whether the fused kernel is
+    # compiled (without Numba it falls back to plain Python)
+    if calc.BACKEND != "numba":
+        return calc.BACKEND
+    import kernels
+
+    if kernels.compiled_kernel() is None:
+        return "numba (uncompiled: numba is not installed)"
+    return "numba (compiled)"
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    # best time per call of fn over repeat runs of at least min_time each
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time and number < 10 ** 6:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Daisyworld.")
+    parser.add_argument("-k", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--backend", choices=calc.BACKENDS, help="backend of calc.RelaxState"
+    )
+    parser.add_argument("--save", help="store the timings in this JSON file")
+    parser.add_argument("--compare", help="JSON file of baseline timings")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown relative to the baseline counted as a regression",
+    )
+    args = parser.parse_args()
+    if args.backend:
+        calc.set_backend(args.backend)
+
+    with open("init_vars.json") as infile:
+        init_vars = json.load(infile)
+    backend = backend_label()
+    print("backend: %s" % backend, flush=True)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        if baseline.get("_backend", "python") != backend:
+            print(
+                "warning: the baseline was timed on backend %s"
+                % baseline.get("_backend", "python"),
+                flush=True,
+            )
+
+    jobs_dir = tempfile.mkdtemp()
+    cases = {}
+    cases.update(model_cases(init_vars))
+    cases.update(plotting_cases(init_vars))
+    cases.update(callback_cases(init_vars, jobs_dir))
+
+    timings = {}
+    regressions = []
+    for name, fn in cases.items():
+        if args.k and args.k not in name:
+            continue
+        timings[name] = measure(fn, args.repeat)
+        line = "%-50s %12.1f us" % (name, timings[name] * 1e6)
+        if name in baseline:
+            ratio = timings[name] / baseline[name]
+            line += "  %5.2fx baseline" % ratio
+            if ratio > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, flush=True)
+    shutil.rmtree(jobs_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as outfile:
+            json.dump(dict(timings, _backend=backend), outfile, indent=4)
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,176 @@
+# file cache.py
+
+# Bounded LRU cache in front of the calculations module. The sliders in app.py
+# move in discrete steps, so the reachable parameter sets are finite and
+# students keep landing on the same ones; solved results are kept, keyed on a
+# canonical hash of the parameter dict.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import calculations as calc
+import ensemble
+import metrics
+import spatial
+import tipping
+
+
+def canonical(value):
+    # make a parameter dict JSON-able with floats rounded to 12 significant
+    # digits, so that e.g. 0.1 + 0.2 and 0.3 map onto the same key
+    if isinstance(value, dict):
+        return {str(key): canonical(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return float("%.12g" % value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def params_key(name, params):
+    # canonical hash of the experiment name and its parameter dict
+    text = json.dumps([name, canonical(params)], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def result_nbytes(result):
+    # approximate memory held by a result tuple
+    nbytes = 0
+    for value in result:
+        if isinstance(value, np.ndarray):
+            nbytes += value.nbytes
+        elif isinstance(value, (list, tuple)):
+            nbytes += 8 * len(value)
+        else:
+            nbytes += 8
+    return nbytes
+
+
+def freeze(result):
+    # cached results are shared between callbacks, so make their arrays
+    # read-only to catch accidental in-place modification
+    for value in result:
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+    return result
+
+
+class ResultCache:
+    # least-recently-used cache of solved results, bounded both in the number
+    # of entries and in the (approximate) memory they hold
+
+    def __init__(self, max_entries=512, max_bytes=128 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        nbytes = result_nbytes(result)
+        if nbytes > self.max_bytes or self.max_entries < 1:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, nbytes)
+            self.nbytes += nbytes
+            # evict the least recently used entries until within bounds
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+        }
+
+    def solve(self, name, solver, params):
+        # return the cached result of solver(**params), solving on a miss
+        key = params_key(name, params)
+        result = self.get(key)
+        if result is None:
+            with metrics.stage("model"):
+                result = freeze(solver(**params))
+            metrics.solved(result)
+            self.put(key, result)
+        return result
+
+
+# shared cache used by the app callbacks
+results = ResultCache()
+
+
+def solve_constant_flux(**params):
+    # cached calc.solve_constant_flux
+    return results.solve("constant_flux", calc.solve_constant_flux, params)
+
+
+def solve_equi_flux(**params):
+    # cached calc.solve_equi_flux
+    return results.solve("equi_flux", calc.solve_equi_flux, params)
+
+
+def solve_spatial(**params):
+    # cached spatial.solve_spatial
+    return results.solve("spatial", spatial.solve_spatial, params)
+
+
+def solve_constant_flux_ensemble(**params):
+    # cached ensemble.solve_constant_flux_ensemble
+    return results.solve(
+        "constant_flux_ensemble", ensemble.solve_constant_flux_ensemble, params
+    )
+
+
+def solve_equi_flux_ensemble(**params):
+    # cached ensemble.solve_equi_flux_ensemble
+    return results.solve(
+        "equi_flux_ensemble", ensemble.solve_equi_flux_ensemble, params
+    )
+
+
+def find_tipping_points(result, solver, options, **params):
+    # cached tipping.find_tipping_points of result, the sweep
+    # calc.solve_equi_flux(**params, **options): the tipping points follow
+    # from the sweep, so they are keyed on its parameters and options (and
+    # the method of solver) rather than bisected again on every response
+    key = params_key("tipping_points", dict(params, **options, solver=solver.method))
+    points = results.get(key)
+    if points is None:
+        with metrics.stage("tipping"):
+            points = tipping.find_tipping_points(**params, result=result, solver=solver)
+        results.put(key, points)
+    return points
@@ -1,5 +1,44 @@
+import os
+
 import numpy as np
 
+from collections import namedtuple
+
+# names of the entries of the state vector, in storage order
+STATE_VARS = ("Sw", "Sb", "Su", "Ap", "Tp", "Tw", "Tb")
+
+# a series of state vectors (daisy generations or equilibrium points) is stored
+# in one preallocated structured array: whole columns can be sliced at once
+# (e.g. xgens["Tw"]) while every row still reads like the old dictionary
+# (e.g. xgens[0]["Tw"])
+state_dtype = np.dtype([(name, np.float64) for name in STATE_VARS])
+
+
+def new_states(n):
+    # preallocate a series of n state vectors
+    return np.zeros(n, dtype=state_dtype)
+
+
+def store_state(states, i, x):
+    # write the state vector x (a dictionary or a row) into row i of states
+    states[i] = tuple([x[name] for name in STATE_VARS])
+
+
+def as_dict(x):
+    # dictionary copy of a single state vector (e.g. a row of a state array)
+    return {name: float(x[name]) for name in STATE_VARS}
+
+
+# results of one solve of each experiment, shared by all figures built from it.
+# iterations and residuals (shape (3, nt): forward, barren and backward pass)
+# are the convergence diagnostics of the equilibrium search, when available.
+ConstantFluxResult = namedtuple("ConstantFluxResult", ["xgens", "gens", "Fsnom"])
+EquiFluxResult = namedtuple(
+    "EquiFluxResult",
+    ["xeq", "xeqbar", "xeqinv", "F", "Fsnom", "iterations", "residuals"],
+    defaults=(None, None),
+)
+
 
 def UpdateAlbedo(x, Albedo):
     # define a function which updates the planetary albedo of the state vector (last entry)
@@ -57,40 +96,233 @@ def UpdateAreas(x, death, minarea, T_min, T_opt):
     x["Su"] = 1 - x["Sw"] - x["Sb"]
 
 
+def StepState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
+    # advance the state vector x by one generation, in place
+    UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+    UpdateAreas(x, death, minarea, T_min, T_opt)
+    UpdateAlbedo(x, Albedo)
+
+
 def NextState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
     # make a copy of the previous statevector to work on
     xnew = x.copy()
-    UpdateTemp(xnew, F, rat, em_p, sig, ins_p, Albedo)
-    UpdateAreas(xnew, death, minarea, T_min, T_opt)
-    UpdateAlbedo(xnew, Albedo)
+    StepState(xnew, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
     return xnew
 
 
-# To aid this exercise write and additional function which updates
-# the state vector until  no noticable change in temperature is happening
-def Equi_state(x0, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
+# convergence criterion of the equilibrium search: stop once one generation
+# changes the planet temperature by at most EQUI_TOL K, or give up after
+# EQUI_MAX_ITER generations (some settings, e.g. white albedo >= 0.95, end up on
+# a limit cycle and would never converge)
+EQUI_TOL = 0.05
+EQUI_MAX_ITER = 1000
+
+# backend of the generation loop of RelaxState (and so of Equi_state and the
+# flux sweeps): "python" steps the state dictionary with the functions above,
+# "numba" runs the fused kernel of kernels.py (compiled if Numba is
+# installed). Chosen with set_backend, or the environment variable
+# DAISYWORLD_BACKEND.
+BACKENDS = ("python", "numba")
+BACKEND = "python"
+
+
+def set_backend(name):
+    global BACKEND
+    if name not in BACKENDS:
+        raise ValueError("unknown backend %r" % name)
+    BACKEND = name
+
+
+set_backend(os.environ.get("DAISYWORLD_BACKEND", "python"))
+
+
+# update the state vector x in place until no noticable change in
+# temperature is happening; returns the number of generations stepped and the
+# last temperature change
+def RelaxState(
+    x,
+    F,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    Albedo,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    tol=EQUI_TOL,
+    max_iter=EQUI_MAX_ITER,
+):
+    if BACKEND == "numba":
+        import kernels
+
+        return kernels.relax_state(
+            x,
+            F,
+            rat,
+            em_p,
+            sig,
+            ins_p,
+            Albedo,
+            death,
+            minarea,
+            T_min,
+            T_opt,
+            tol,
+            max_iter,
+        )
     dT = 2
-    x = x0.copy()
+    n = 0
     temp = x["Tp"]
-    while dT > 0.05:
-        x = NextState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+    while dT > tol and n < max_iter:
+        StepState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+        n += 1
         dT = abs(temp - x["Tp"])
         temp = x["Tp"]
+    return n, dT
+
+
+# To aid this exercise write and additional function which updates
+# the state vector until  no noticable change in temperature is happening
+def Equi_state(x0, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
+    x = as_dict(x0)
+    RelaxState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
     return x
 
 
-def update_equi_flux(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
+# the varying flux experiment sweeps the solar flux from FRAC_MIN to FRAC_MAX
+# times the nominal flux in EQUI_NT steps, forward from a seeded planet, forward
+# from a barren planet and backward from the end of the forward pass
+FRAC_MIN = 0.6
+FRAC_MAX = 1.65
+EQUI_NT = 200
+EQUI_PASSES = ("forward", "barren", "backward")
+
+
+def flux_fractions(nt=EQUI_NT):
+    # fractions of the nominal solar flux visited by the varying flux experiment
+    # amount of steps
+    Fracmin = FRAC_MIN
+    Fracmax = FRAC_MAX
+    dF = (Fracmax - Fracmin) / nt
+    return [dF * i + Fracmin for i in range(nt)]
+
+
+def flux_times(F, nt=EQUI_NT):
+    # simulation time at which the flux fraction F is reached, if the flux
+    # grows by one step of the nt-step grid per unit of time
+    return (np.asarray(F) - FRAC_MIN) / ((FRAC_MAX - FRAC_MIN) / nt)
+
+
+def sweep_flux(relax, x0, F, Fsnom, params, progress=None):
+    # continuation: relax a copy of x0 through the flux fractions F in turn.
+    # Returns the states (x0 first) and the convergence diagnostics. If given,
+    # progress(i, xs) is called once xs[: i + 1] are done.
+    xs = new_states(len(F) + 1)
+    iterations = np.zeros(len(F) + 1, dtype=int)
+    residuals = np.full(len(F) + 1, np.nan)
+    store_state(xs, 0, x0)
+    x = as_dict(x0)
+    for i, Fr in enumerate(F, 1):
+        iterations[i], residuals[i] = relax(x, Fr * Fsnom, *params)
+        store_state(xs, i, x)
+        if progress is not None:
+            progress(i, xs)
+    return xs, iterations, residuals
+
+
+def adaptive_sweep_flux(
+    relax,
+    x0,
+    F,
+    Fsnom,
+    params,
+    min_step=0.5,
+    max_step=8,
+    dT_max=3.0,
+    dS_max=0.08,
+    progress=None,
+):
+    # continuation over the range of the uniform flux grid F with adaptive
+    # steps: up to max_step grid steps where the equilibrium is smooth, down to
+    # min_step grid steps where the planet temperature jumps by more than
+    # dT_max K or the daisy areas by more than dS_max (the tipping points).
+    # Returns the flux fractions visited, the states (x0 first) and the
+    # convergence diagnostics; rejected trial steps count towards the
+    # iterations of the next accepted point. If given, progress(Fs, xs) is
+    # called with the fluxes and states accepted so far after every point.
+    dF = F[1] - F[0]
+    t_end = len(F) - 1
+    t = 0
+    step = 1
+    x = as_dict(x0)
+    Fs, xs, iterations, residuals = [F[0]], [x0], [0], [np.nan]
+    wasted = 0
+    while t < t_end:
+        step = min(step, t_end - t)
+        trial = dict(x)
+        Fr = dF * (t + step) + F[0]
+        n, res = relax(trial, Fr * Fsnom, *params)
+        dT = abs(trial["Tp"] - x["Tp"])
+        dS = abs(trial["Sw"] - x["Sw"]) + abs(trial["Sb"] - x["Sb"])
+        if (dT > dT_max or dS > dS_max) and step > min_step:
+            wasted += n
+            step /= 2
+            continue
+        t += step
+        x = trial
+        Fs.append(Fr)
+        xs.append(trial)
+        iterations.append(n + wasted)
+        residuals.append(res)
+        wasted = 0
+        if progress is not None:
+            progress(Fs, xs)
+        if dT < dT_max / 4 and dS < dS_max / 4:
+            step = min(2 * step, max_step)
+
+    states = new_states(len(xs))
+    for i, xi in enumerate(xs):
+        store_state(states, i, xi)
+    return Fs, states, np.array(iterations), np.array(residuals)
+
+
+def solve_equi_flux(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    solver=None,
+    nt=EQUI_NT,
+    passes=EQUI_PASSES,
+    adaptive=False,
+    progress=None,
 ):
     # Experiment 2 Planet response to varying solar flux
+    #
+    # nt sets the resolution of the flux grid and passes the subset of
+    # EQUI_PASSES to compute; the result has None for the others. With
+    # adaptive=True the forward pass takes large flux steps where the
+    # equilibrium is smooth and refines around the tipping points, and the
+    # other passes visit the same fluxes. If given, progress(name, F, states)
+    # is called as each pass goes, with the flux fractions and state vectors
+    # done so far, in the order visited (the backward pass starts from the end
+    # of the forward one, at F[-1], and visits F[::-1]).
+
+    # the equilibrium engine: anything with the signature of RelaxState, e.g.
+    # the relax method of an equilibrium.EquilibriumSolver
+    relax = RelaxState if solver is None else solver.relax
+    params = (rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
 
     # set up variation of solar radiation
-    nt = 200
-    # amount of steps
-    Fracmin = 0.6
-    Fracmax = 1.65
-    dF = (Fracmax - Fracmin) / nt
-    F = [dF * i + Fracmin for i in range(nt)]
+    F = flux_fractions(nt)
 
     # set up initial condition
     # initial condition state vector
@@ -115,115 +347,183 @@ def update_equi_flux(
     # and the temperature
     UpdateTemp(x0bar, F[0] * Fsnom, rat, em_p, sig, ins_p, Albedo)
 
-    # loop over radiation variation
-    xeq = []
-    xeq.append(x0)
-    xeqbar = []
-    xeqbar.append(x0bar)
-
-    for Fr in F[1:]:
-        xeq.append(
-            Equi_state(
-                xeq[-1],
-                Fr * Fsnom,
-                rat,
-                em_p,
-                sig,
-                ins_p,
-                Albedo,
-                death,
-                minarea,
-                T_min,
-                T_opt,
-            )
+    # loop over radiation variation. The forward pass is also needed to seed
+    # the backward one (and, when adaptive, to choose the fluxes). The
+    # generations stepped and the final temperature change of every
+    # equilibrium are kept as convergence diagnostics.
+    def report(name, F=None):
+        # progress hook of sweep_flux over F (adaptive_sweep_flux for F=None)
+        # for the pass name
+        if progress is None:
+            return None
+        if F is None:
+            return lambda Fs, xs: progress(name, Fs, xs)
+        return lambda i, xs: progress(name, F[: i + 1], xs[: i + 1])
+
+    xeq = None
+    if adaptive:
+        F, xeq, it_eq, res_eq = adaptive_sweep_flux(
+            relax, x0, F, Fsnom, params, progress=report("forward")
+        )
+    elif "forward" in passes or "backward" in passes:
+        xeq, it_eq, res_eq = sweep_flux(
+            relax, x0, F[1:], Fsnom, params, report("forward", F)
         )
-        xeqbar.append(
-            Equi_state(
-                xeqbar[-1],
-                Fr * Fsnom,
-                rat,
-                em_p,
-                sig,
-                ins_p,
-                Albedo,
-                death,
-                minarea,
-                T_min,
-                T_opt,
-            )
+    iterations = np.zeros((3, len(F)), dtype=int)
+    residuals = np.full((3, len(F)), np.nan)
+    if xeq is not None:
+        iterations[0], residuals[0] = it_eq, res_eq
+
+    xeqbar = None
+    if "barren" in passes:
+        xeqbar, iterations[1], residuals[1] = sweep_flux(
+            relax, x0bar, F[1:], Fsnom, params, report("barren", F)
         )
 
     # also run the  experiment backwards
     # (use the end value of the forward run as starting point)
-    xeqinv = []
-    xeqinv.append(xeq[-1])
-
-    for Fr in F[::-1]:
-        xeqinv.append(
-            Equi_state(
-                xeqinv[-1],
-                Fr * Fsnom,
-                rat,
-                em_p,
-                sig,
-                ins_p,
-                Albedo,
-                death,
-                minarea,
-                T_min,
-                T_opt,
-            )
+    xeqinv = None
+    if "backward" in passes:
+        xeqinv, it_inv, res_inv = sweep_flux(
+            relax,
+            xeq[-1],
+            F[::-1],
+            Fsnom,
+            params,
+            report("backward", np.append(F[-1], F[::-1])),
         )
+        # reverse the vector (and its diagnostics)
+        xeqinv = xeqinv[::-1][1:]
+        iterations[2], residuals[2] = it_inv[::-1][1:], res_inv[::-1][1:]
 
-    # reverse the vector
-    xeqinv = xeqinv[::-1][1:]
+    if "forward" not in passes:
+        xeq = None
 
-    return (xeq, xeqbar, xeqinv, F)
+    return EquiFluxResult(xeq, xeqbar, xeqinv, F, Fsnom, iterations, residuals)
 
 
-def update_constant_flux(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas
+def update_equi_flux(
+    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, solver=None
+):
+    result = solve_equi_flux(
+        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, solver
+    )
+    return (result.xeq, result.xeqbar, result.xeqinv, result.F)
+
+
+def iter_constant_flux(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    areas=None,
+    ngen=None,
+    tol=None,
+    out=None,
 ):
-    # First experiment
+    # First experiment as a stream: yields the state vector of every daisy
+    # generation in turn, starting with the initial state, as a row of a state
+    # array. Generation g is written to row g of out (see new_states) if given;
+    # otherwise every generation reuses the same row, so that long runs take
+    # constant memory (copy a row, e.g. with as_dict, to keep it). Stops after
+    # ngen generations (never for ngen=None, at the end of out if given), or
+    # once one generation changes the planet temperature by at most tol K
+    # (that generation is still yielded).
+    if areas is None:
+        areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
+    if out is None:
+        states = new_states(1)
+    else:
+        states = out
+        ngen = len(out) if ngen is None else min(ngen, len(out))
     F = Fsnom * 1  # solar radiation
 
     # initial condition state vector
-    x0 = {}
-    x0["Sw"] = areas["w"]
-    x0["Sb"] = areas["b"]
-    x0["Su"] = 1 - x0["Sw"] - x0["Sb"]
+    x = {}
+    x["Sw"] = areas["w"]
+    x["Sb"] = areas["b"]
+    x["Su"] = 1 - x["Sw"] - x["Sb"]
     # note that we also need to initiate the planetary Albedo
-    UpdateAlbedo(x0, Albedo)
+    UpdateAlbedo(x, Albedo)
     # and the temperature
-    UpdateTemp(x0, F, rat, em_p, sig, ins_p, Albedo)
-
-    # loop over generations
-    ngen = 40
-
-    xgens = []
-    xgens.append(x0)
-    for g in range(ngen - 1):
-        xgens.append(
-            NextState(
-                xgens[-1],
-                F,
-                rat,
-                em_p,
-                sig,
-                ins_p,
-                Albedo,
-                death,
-                minarea,
-                T_min,
-                T_opt,
-            )
-        )
+    UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+    store_state(states, 0, x)
+    yield states[0]
+
+    # loop over generations, stepping the state vector in place
+    g = 1
+    while ngen is None or g < ngen:
+        temp = x["Tp"]
+        StepState(x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+        i = 0 if out is None else g
+        store_state(states, i, x)
+        yield states[i]
+        # (the temperature lags the areas by one generation, so the first
+        # step never changes it)
+        if tol is not None and g > 1 and abs(temp - x["Tp"]) <= tol:
+            return
+        g += 1
+
+
+def update_constant_flux(
+    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas, ngen=40
+):
+    # First experiment: the first ngen generations, streamed into one array
+    xgens = new_states(ngen)
+    stream = iter_constant_flux(
+        Fsnom,
+        Albedo,
+        rat,
+        em_p,
+        sig,
+        ins_p,
+        death,
+        minarea,
+        T_min,
+        T_opt,
+        areas,
+        ngen,
+        out=xgens,
+    )
+    for _ in stream:  # every generation is written into xgens
+        pass
 
     gens = [i for i in range(ngen)]
 
     return xgens, gens
 
 
+def solve_constant_flux(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    areas=None,
+    ngen=40,
+):
+    # initial areas are embedded in here but can be passed in as an
+    # argument if we want to change the initial conditions externally...
+    if areas is None:
+        areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
+
+    xgens, gens = update_constant_flux(
+        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas, ngen
+    )
+    return ConstantFluxResult(xgens, gens, Fsnom)
+
+
 def update_solar_constant(solar_distance):
     luminosity = 10e26
     # nominal flux in W/m^2
@@ -0,0 +1,240 @@
+# file daisyworld.py
+
+# Headless command line runner for the Daisyworld experiments, for generating
+# datasets and checking the model at scale without the dashboard. It only
+# needs NumPy (no Dash or Plotly). From this directory:
+#   python -m daisyworld run --mode equi-flux --params grid.json --out results
+#
+# The parameter file holds overrides of init_vars.json, and every list in it is
+# an axis of the parameter grid, e.g.
+#   {"Albedo": {"w": [0.6, 0.7, 0.8]}, "ins_p": [0, 0.25, 0.5]}
+# runs the 9 combinations. A "distance" entry (in AU, as the tab 1 slider)
+# sets Fsnom. The grid is solved in chunks with the batched solver and the
+# results are streamed to disk as one table, with a row per planet and
+# generation (constant-flux) or per planet, pass and flux (equi-flux): either a
+# directory with one .npy file per column, or a .parquet file (needs pyarrow).
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+import batch
+import calculations as calc
+from executor import SweepExecutor
+
+MODES = ("constant-flux", "equi-flux")
+
+
+def merge(params, overrides):
+    # nested dict params updated with overrides (copied)
+    params = copy.deepcopy(params)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(params.get(key), dict):
+            params[key] = merge(params[key], value)
+        else:
+            params[key] = value
+    return params
+
+
+def grid_axes(params, path=()):
+    # [(column name, path of keys, values)] of the list-valued leaves of
+    # params; e.g. params["Albedo"]["w"] becomes the column "Albedo_w"
+    axes = []
+    for key, value in params.items():
+        if isinstance(value, dict):
+            axes += grid_axes(value, path + (key,))
+        elif isinstance(value, list):
+            axes.append(("_".join(path + (key,)), path + (key,), value))
+    return axes
+
+
+def parameter_grid(init_vars, overrides):
+    # batched parameter dict of all grid points and their parameter columns
+    params = merge(init_vars, overrides)
+    axes = grid_axes(params)
+    points = np.array(list(itertools.product(*[values for _, _, values in axes])))
+    columns = {}
+    for j, (name, path, _) in enumerate(axes):
+        columns[name] = points[:, j].astype(np.float64)
+        leaf = params
+        for key in path[:-1]:
+            leaf = leaf[key]
+        leaf[path[-1]] = columns[name]
+    if "distance" in params:
+        distance = params.pop("distance")
+        params["Fsnom"] = calc.update_solar_constant(calc.fromAU(np.asarray(distance)))
+    params, n = batch.broadcast_params(**params)
+    return params, n, columns
+
+
+# the batched solver of each mode
+SOLVERS = {
+    "constant-flux": batch.update_constant_flux_batch,
+    "equi-flux": batch.update_equi_flux_batch,
+}
+
+
+def result_columns(mode, result):
+    # the result columns of a batched solve (see SOLVERS), with a row per
+    # planet and generation or per planet, pass and flux
+    if mode == "constant-flux":
+        xgens, gens = result
+        ngen, n = xgens.shape
+        columns = {
+            "planet": np.repeat(np.arange(n), ngen),
+            "gen": np.tile(np.asarray(gens), n),
+        }
+        states = xgens.T.ravel()
+    else:
+        xeq, xeqbar, xeqinv, F = result
+        nt, n = xeq.shape
+        # xeqinv[i] is the equilibrium at F[i + 1], and its last entry the end
+        # value of the forward run (at F[-1]); label its rows accordingly
+        F = np.asarray(F)
+        Finv = np.append(F[1:], F[-1])
+        columns = {
+            "planet": np.repeat(np.arange(n), 3 * nt),
+            "pass": np.tile(np.repeat(np.array(calc.EQUI_PASSES), nt), n),
+            "F": np.tile(np.concatenate([F, F, Finv]), n),
+        }
+        states = np.stack([xeq.T, xeqbar.T, xeqinv.T], axis=1).ravel()
+    for name in calc.STATE_VARS:
+        columns[name] = states[name]
+    return columns
+
+
+class NpyWriter:
+    # writes a table as one .npy file per column into a directory, streaming
+    # the rows into memory-mapped files of the final size
+
+    def __init__(self, directory, nrows):
+        self.directory = directory
+        self.nrows = nrows
+        self.files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, start, columns):
+        for name, values in columns.items():
+            if name not in self.files:
+                self.files[name] = np.lib.format.open_memmap(
+                    os.path.join(self.directory, name + ".npy"),
+                    mode="w+",
+                    dtype=values.dtype,
+                    shape=(self.nrows,),
+                )
+            self.files[name][start : start + len(values)] = values
+
+    def close(self):
+        for values in self.files.values():
+            values.flush()
+
+
+class ParquetWriter:
+    # writes a table into a .parquet file, one row group per chunk
+
+    def __init__(self, path, nrows):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("writing .parquet files needs pyarrow installed")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def write(self, start, columns):
+        table = self.pa.table(columns)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(out, nrows):
+    if out.endswith(".parquet"):
+        return ParquetWriter(out, nrows)
+    return NpyWriter(out, nrows)
+
+
+def run(mode, init_vars, overrides, out, chunk_size=1000, workers=1, **options):
+    # solve the grid of overrides (see above) and stream the table to out.
+    # The planets are solved in waves of one chunk per worker process
+    # (SweepExecutor.solve_batch), and every wave is written as it comes in.
+    params, n, param_columns = parameter_grid(init_vars, overrides)
+    rows_per_planet = 40 if mode == "constant-flux" else 3 * calc.EQUI_NT
+    writer = open_writer(out, n * rows_per_planet)
+    if mode == "constant-flux":
+        options = dict(options, areas={"w": 0.01, "b": 0.01})
+
+    with SweepExecutor(workers) as pool:
+        wave_size = chunk_size * pool.max_workers
+        for start in range(0, n, wave_size):
+            stop = min(start + wave_size, n)
+            result = pool.solve_batch(
+                SOLVERS[mode],
+                batch.take_params(params, slice(start, stop)),
+                chunk_size,
+                **options
+            )
+            columns = result_columns(mode, result)
+            # planet numbers of the whole grid, and the grid parameters
+            planets = columns["planet"] + start
+            columns["planet"] = planets
+            for name, values in param_columns.items():
+                columns[name] = values[planets]
+            writer.write(start * rows_per_planet, columns)
+            print("%s: %d/%d" % (mode, stop, n), file=sys.stderr, flush=True)
+    writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m daisyworld", description="Run Daisyworld experiments."
+    )
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--mode", choices=MODES, required=True)
+    parser.add_argument(
+        "--params",
+        help="JSON file of overrides of init_vars.json; lists are grid axes",
+    )
+    parser.add_argument(
+        "--out",
+        required=True,
+        help="output: a .parquet file, or a directory of .npy columns",
+    )
+    parser.add_argument("--init-vars", default="init_vars.json")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes (0: all cores)"
+    )
+    parser.add_argument("--tol", type=float, default=calc.EQUI_TOL)
+    parser.add_argument("--max-iter", type=int, default=calc.EQUI_MAX_ITER)
+    args = parser.parse_args()
+
+    with open(args.init_vars) as infile:
+        init_vars = json.load(infile)
+    overrides = {}
+    if args.params:
+        with open(args.params) as infile:
+            overrides = json.load(infile)
+    options = {}
+    if args.mode == "equi-flux":
+        options = {"tol": args.tol, "max_iter": args.max_iter}
+    run(
+        args.mode,
+        init_vars,
+        overrides,
+        args.out,
+        args.chunk_size,
+        args.workers or None,
+        **options
+    )
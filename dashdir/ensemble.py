@@ -0,0 +1,210 @@
+# file ensemble.py
+
+# Monte Carlo ensembles of Daisyworld planets, to see how robust the
+# regulation is to uncertain parameters. Thousands of planets, each with its
+# own death rates, optimal temperatures and daisy albedos drawn around the
+# given values (perturb_params), are stepped together with the batched model
+# of batch.py. Optionally the solar flux is noisy as well: every planet sees
+# its own random flux in every generation (constant flux experiment) or at
+# every step of the flux sweep (varying flux experiment).
+#
+# Only the percentiles over the planets are kept: after every generation or
+# flux step the states are reduced to PERCENTILES, so memory stays at one
+# state per planet plus the bands, however long the run.
+
+from collections import namedtuple
+
+import numpy as np
+
+import batch
+import calculations as calc
+
+# percentiles kept of every entry of the state vector: the lower edge of the
+# band, the median and the upper edge
+PERCENTILES = (5, 50, 95)
+ENSEMBLE_SIZE = 1000
+
+# standard deviations of the parameter perturbations: death rate, optimal
+# temperature (K) and albedo of each daisy species (the barren albedo is kept)
+SPREAD = {"death": 0.05, "T_opt": 2.0, "Albedo": 0.05}
+
+# T_opt is kept at least this far (K) above T_min, so that every species has a
+# growth curve
+MIN_GROWTH_RANGE = 1.0
+
+# results: the percentiles of the states of every generation or flux step,
+# structured arrays (see calc.state_dtype) of shape (len(percentiles), n), so
+# that e.g. xgens[1]["Tp"] is the median planet temperature
+ConstantFluxEnsemble = namedtuple(
+    "ConstantFluxEnsemble", ["xgens", "gens", "Fsnom", "percentiles", "size"]
+)
+EquiFluxEnsemble = namedtuple(
+    "EquiFluxEnsemble",
+    ["xeq", "xeqbar", "xeqinv", "F", "Fsnom", "percentiles", "size"],
+)
+
+
+def perturb_params(params, size, spread, rng):
+    # copy of the parameter dictionary params with the per-species entries
+    # named in spread replaced by arrays of size random draws
+    params = dict(params)
+    for key in ("Albedo", "death", "T_min", "T_opt"):
+        params[key] = dict(params[key])
+    for key, sd in spread.items():
+        for species in ("w", "b"):
+            params[key][species] = params[key][species] + sd * rng.standard_normal(size)
+    # keep the draws physical
+    for species in ("w", "b"):
+        params["Albedo"][species] = np.clip(params["Albedo"][species], 0, 1)
+        params["death"][species] = np.maximum(params["death"][species], 0)
+        params["T_opt"][species] = np.maximum(
+            params["T_opt"][species], params["T_min"][species] + MIN_GROWTH_RANGE
+        )
+    return params
+
+
+def reduce_states(x, percentiles):
+    # percentiles over the planets of the states x, shape (len(percentiles),)
+    bands = calc.new_states(len(percentiles))
+    values = np.percentile(
+        np.stack([x[name] for name in calc.STATE_VARS]), percentiles, axis=1
+    )
+    for name, column in zip(calc.STATE_VARS, values.T):
+        bands[name] = column
+    return bands
+
+
+def noisy(F, noise, rng):
+    # the flux F of every planet, with random relative fluctuations of
+    # standard deviation noise
+    if noise == 0:
+        return F
+    return F * (1 + noise * rng.standard_normal(len(F)))
+
+
+def ensemble_params(params, size, spread, seed):
+    # batched parameters of size perturbed planets, and the random generator
+    # to continue with
+    if spread is None:
+        spread = SPREAD
+    rng = np.random.default_rng(seed)
+    p, _ = batch.broadcast_params(**perturb_params(params, size, spread, rng))
+    return p, rng
+
+
+def solve_constant_flux_ensemble(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    areas=None,
+    ngen=40,
+    size=ENSEMBLE_SIZE,
+    spread=None,
+    noise=0.0,
+    seed=0,
+    percentiles=PERCENTILES,
+):
+    # First experiment for an ensemble of size planets: the percentiles of
+    # every generation. The same seed gives the same ensemble.
+    if areas is None:
+        areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
+    params = dict(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    p, rng = ensemble_params(params, size, spread, seed)
+    F = p["Fsnom"] * 1  # solar radiation
+    x = batch.initial_states(F, p, areas)
+
+    xgens = calc.new_states((len(percentiles), ngen))
+    xgens[:, 0] = reduce_states(x, percentiles)
+    for g in range(1, ngen):
+        batch.StepStates(x, noisy(F, noise, rng), p)
+        xgens[:, g] = reduce_states(x, percentiles)
+
+    gens = [i for i in range(ngen)]
+
+    return ConstantFluxEnsemble(xgens, gens, Fsnom, tuple(percentiles), size)
+
+
+def solve_equi_flux_ensemble(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    size=ENSEMBLE_SIZE,
+    spread=None,
+    noise=0.0,
+    seed=0,
+    percentiles=PERCENTILES,
+    nt=calc.EQUI_NT,
+    passes=calc.EQUI_PASSES,
+    tol=calc.EQUI_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+):
+    # Experiment 2 for an ensemble of size planets: the percentiles of the
+    # equilibria of the passes (a subset of calc.EQUI_PASSES; None for the
+    # others) at every flux step. With noise, every planet sees its own flux
+    # at every step.
+    params = dict(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    p, rng = ensemble_params(params, size, spread, seed)
+    F = calc.flux_fractions(nt)
+    nperc = len(percentiles)
+
+    def sweep(x, fractions):
+        # relax the planets x through the flux fractions in turn, returning the
+        # percentiles of x (as given) and of every equilibrium
+        bands = calc.new_states((nperc, len(fractions) + 1))
+        bands[:, 0] = reduce_states(x, percentiles)
+        for i, Fr in enumerate(fractions, 1):
+            batch.RelaxStates(x, noisy(Fr * p["Fsnom"], noise, rng), p, tol, max_iter)
+            bands[:, i] = reduce_states(x, percentiles)
+        return bands
+
+    F0 = noisy(F[0] * p["Fsnom"], noise, rng)
+    xeq = xeqbar = xeqinv = None
+    if "forward" in passes or "backward" in passes:
+        x = batch.initial_states(F0, p, {"w": 0.01, "b": 0.01})
+        xeq = sweep(x, F[1:])
+    if "barren" in passes:
+        xbar = batch.initial_states(F0, p, {"w": 0.0, "b": 0.0})
+        xeqbar = sweep(xbar, F[1:])
+    if "backward" in passes:
+        # from the end of the forward run (x), as in calc.solve_equi_flux
+        xeqinv = sweep(x, F[::-1])[:, ::-1][:, 1:]
+    if "forward" not in passes:
+        xeq = None
+
+    return EquiFluxEnsemble(xeq, xeqbar, xeqinv, F, Fsnom, tuple(percentiles), size)
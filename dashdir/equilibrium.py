@@ -0,0 +1,387 @@
+# file equilibrium.py
+
+# Pluggable equilibrium engine for the varying flux experiment. An equilibrium
+# is a fixed point s = Phi(s) of one daisy generation acting on the areas
+# s = (Sw, Sb) (the barren area, albedo and temperatures all follow from s).
+# Available methods:
+#   "fixed_point": plain time-stepping, i.e. calc.RelaxState (the original)
+#   "anderson":    the same iteration with Anderson acceleration
+#   "newton":      Newton root-find on Phi(s) - s with a finite-difference
+#                  Jacobian, falling back to plain steps when it does not help
+#   "steady_state": plain steps, but a relaxation still drifting one way
+#                  after STEADY_AFTER of them jumps to the nearest stable
+#                  steady state that way, solved for directly on every branch
+#                  (see steady_states); plain steps if there is none (e.g.
+#                  limit cycles)
+# Every method stops once one more generation changes the planet temperature
+# by at most tol K, or after max_iter generations, and reports both numbers.
+#
+# Use it through calc.solve_equi_flux(..., solver=EquilibriumSolver("newton")).
+
+import itertools
+
+import numpy as np
+
+import calculations as calc
+
+METHODS = ("fixed_point", "anderson", "newton", "steady_state")
+
+# grid points per branch on which steady_states brackets the roots
+STEADY_SAMPLES = 128
+# the "steady_state" method takes up to STEADY_AFTER plain steps before it
+# looks for a steady state, and accepts one if it settles within
+# STEADY_CONFIRM plain steps
+STEADY_AFTER = 20
+STEADY_CONFIRM = 5
+
+
+def planet_temp(Ap, F, rat, em_p, sig):
+    # planet temperature for the planetary albedo Ap, as in calc.UpdateTemp
+    return np.sqrt(np.sqrt(F * (1 - Ap) * rat / em_p / sig))
+
+
+def set_areas(x, s, minarea, Albedo):
+    # put the areas s into the state vector x, keeping them physical: areas
+    # which are exactly zero stay zero, living ones stay above minarea and the
+    # daisies cannot cover more than the whole planet
+    sw, sb = s
+    sw = 0.0 if x["Sw"] == 0 else max(sw, minarea)
+    sb = 0.0 if x["Sb"] == 0 else max(sb, minarea)
+    total = sw + sb
+    if total > 1:
+        sw, sb = sw / total, sb / total
+    x["Sw"] = sw
+    x["Sb"] = sb
+    x["Su"] = 1 - sw - sb
+    calc.UpdateAlbedo(x, Albedo)
+
+
+def steady_state(s, F, rat, em_p, sig, ins_p, Albedo):
+    # the state vector with the areas s and the temperatures in balance with
+    # the albedo they give
+    x = {"Sw": s[0], "Sb": s[1], "Su": 1 - s[0] - s[1]}
+    calc.UpdateAlbedo(x, Albedo)
+    return calc.UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+
+
+def growth_curves(F, rat, em_p, sig, ins_p, Albedo, T_min, T_opt):
+    # function of the planetary albedo Ap (a 1-D array) giving the growth
+    # rates (calc.DaisyGrowth) of the white and black daisies, shape (2, n)
+    Fs = F * (1 - np.array([[Albedo["w"]], [Albedo["b"]]])) * rat / em_p
+    T_opt = np.array([[T_opt["w"]], [T_opt["b"]]])
+    width = np.array([[T_min["w"]], [T_min["b"]]]) - T_opt
+
+    def rates(Ap):
+        Fp = F * (1 - Ap) * rat / em_p
+        T = np.sqrt(np.sqrt((ins_p * (Fs - Fp) + Fp) / sig))
+        return np.maximum(1 - ((T - T_opt) / width) ** 2, 0)
+
+    return rates
+
+
+def secant(a, b, fa, fb):
+    # the zero of the line through (a, fa) and (b, fb) (a where flat)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(fb != fa, b - fb * (b - a) / (fb - fa), a)
+
+
+def find_roots(fun, lo, hi, samples=STEADY_SAMPLES):
+    # roots of the vectorized function fun in [lo, hi]: bracketed on a grid,
+    # then two regula falsi steps (plenty, as the state is polished by plain
+    # steps afterwards)
+    a = np.linspace(lo, hi, samples)
+    fa = fun(a)
+    i = np.nonzero(fa[:-1] * fa[1:] <= 0)[0]
+    if not len(i):
+        return a[i]
+    a, b, fa, fb = a[i], a[i + 1], fa[i], fa[i + 1]
+    c = secant(a, b, fa, fb)
+    fc = fun(c)
+    left = fa * fc <= 0
+    return secant(
+        np.where(left, a, c),
+        np.where(left, c, b),
+        np.where(left, fa, fc),
+        np.where(left, fc, fb),
+    )
+
+
+def alike(ins_p, Albedo, death, T_min, T_opt):
+    # True if white and black daisies always grow alike: they have the same
+    # temperature (no insulation, or equal albedos) and the same growth curve
+    # and death rate. Their areas then keep their ratio, and both living is a
+    # line of steady states rather than a point.
+    return (
+        (ins_p == 0 or Albedo["w"] == Albedo["b"])
+        and T_min["w"] == T_min["b"]
+        and T_opt["w"] == T_opt["b"]
+        and death["w"] == death["b"]
+    )
+
+
+def steady_states(
+    x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt, monotone=False
+):
+    # the stable steady states [(Sw, Sb)] reachable from the state vector x.
+    # At a steady state each species either has no area at all (if it has
+    # none in x, it never grows), sits at minarea with its growth too low to
+    # spread (growth rate * barren area <= death rate), or lives in balance
+    # (growth rate * barren area = death rate). Every combination is a branch,
+    # solved as a 1-D root-find along the area of the one living species, or
+    # on the albedo if both live; the solutions are checked for feasibility
+    # and stability (the Jacobian of one generation along the branch has all
+    # its eigenvalues inside the unit circle; with monotone, real and positive
+    # as well, so that plain steps approach the steady state without
+    # overshooting or spiralling).
+    params = (F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+    An, Aw, Ab = Albedo["none"], Albedo["w"], Albedo["b"]
+    deaths = (death["w"], death["b"])
+    rates = growth_curves(F, rat, em_p, sig, ins_p, Albedo, T_min, T_opt)
+    same = alike(ins_p, Albedo, death, T_min, T_opt)
+
+    def line(base, direction, lo, hi, i):
+        # steady states base + t * direction, lo <= t <= hi, in balance for
+        # the living species i
+        def balance(t):
+            Sw = base[0] + t * direction[0]
+            Sb = base[1] + t * direction[1]
+            Su = 1 - Sw - Sb
+            return rates(An * Su + Aw * Sw + Ab * Sb)[i] * Su - deaths[i]
+
+        return [
+            [base[0] + t * direction[0], base[1] + t * direction[1]]
+            for t in find_roots(balance, lo, hi)
+        ]
+
+    def balance(Ap):
+        # both living: equal growth-to-death ratios (undefined where one
+        # cannot grow, or the clipped growth rates would balance everywhere)
+        gw, gb = rates(Ap)
+        with np.errstate(invalid="ignore"):
+            return np.where(
+                (gw > 0) & (gb > 0), gw * deaths[1] - gb * deaths[0], np.nan
+            )
+
+    kinds = [("zero",) if x[S] == 0 else ("pinned", "living") for S in ("Sw", "Sb")]
+    found = []
+    for kind in itertools.product(*kinds):
+        fixed = [0.0 if k == "zero" else minarea for k in kind]
+        living = [i for i in range(2) if kind[i] == "living"]
+        # the directions along which the branch is checked for stability
+        directions = [[float(i == 0), float(i == 1)] for i in living]
+        if not living:
+            candidates = [fixed]
+        elif len(living) == 1 and same and kind[1 - living[0]] == "pinned":
+            # in balance for one of alike daisies, the other one is in
+            # balance too rather than held at minarea (it is on the line)
+            candidates = []
+        elif len(living) == 1:
+            i = living[0]
+            base = list(fixed)
+            base[i] = 0.0
+            candidates = line(base, directions[0], minarea, 1 - fixed[1 - i], i)
+        elif same:
+            # along the line of the current ratio of the areas (the other
+            # direction is neutral)
+            r = x["Sw"] / (x["Sw"] + x["Sb"])
+            directions = [[r, 1 - r]]
+            lo = minarea / min(r, 1 - r)
+            candidates = line([0.0, 0.0], directions[0], lo, 1, 0) if lo < 1 else []
+        elif Aw != Ab:
+            # the albedo from the growth rates, the barren area from the
+            # balance and then the daisy areas from the albedo
+            candidates = []
+            for Ap in find_roots(balance, min(An, Aw, Ab), max(An, Aw, Ab)):
+                Su = deaths[0] / rates(np.array([Ap]))[0, 0]
+                Sw = (Ap - An * Su - Ab * (1 - Su)) / (Aw - Ab)
+                candidates.append([Sw, 1 - Su - Sw])
+        else:
+            candidates = []
+
+        for s in candidates:
+            if s[0] + s[1] > 1 or any(s[i] < minarea for i in living):
+                continue
+            Su = 1 - s[0] - s[1]
+            g = rates(np.array([An * Su + Aw * s[0] + Ab * s[1]]))[:, 0]
+            if any(g[i] * Su > deaths[i] for i in range(2) if kind[i] == "pinned"):
+                continue
+            if directions and not stable(s, directions, params, monotone):
+                continue
+            found.append((float(s[0]), float(s[1])))
+    return found
+
+
+def stable(s, directions, params, monotone=False):
+    # True if the steady areas s attract the areas along the directions,
+    # from a finite-difference Jacobian of one generation
+    F, rat, em_p, sig, ins_p, Albedo = params[:6]
+
+    def generation(s):
+        x = steady_state(s, F, rat, em_p, sig, ins_p, Albedo)
+        calc.StepState(x, *params)
+        return np.array([x["Sw"], x["Sb"]])
+
+    eps = 1e-7
+    D = np.array(directions).T
+    g = generation(s)
+    dg = np.array([generation(s + eps * D[:, k]) - g for k in range(D.shape[1])]).T
+    # (the directions are orthogonal)
+    J = (D.T @ dg) / (eps * (D * D).sum(axis=0)[:, None])
+    eigvals = np.linalg.eigvals(J)
+    if monotone and np.any((eigvals.imag != 0) | (eigvals.real <= 0)):
+        return False
+    return np.max(np.abs(eigvals)) < 1
+
+
+class EquilibriumSolver:
+    def __init__(
+        self,
+        method="fixed_point",
+        tol=calc.EQUI_TOL,
+        max_iter=calc.EQUI_MAX_ITER,
+        depth=2,
+    ):
+        if method not in METHODS:
+            raise ValueError("unknown equilibrium method %r" % method)
+        self.method = method
+        self.tol = tol
+        self.max_iter = max_iter
+        # number of previous iterates used by Anderson acceleration
+        self.depth = depth
+
+    def relax(self, x, F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
+        # relax the state vector x in place; same signature and return value
+        # (generations stepped, last temperature change) as calc.RelaxState
+        params = (F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+        if self.method == "fixed_point":
+            return calc.RelaxState(x, *params, tol=self.tol, max_iter=self.max_iter)
+        if self.method == "anderson":
+            return self._anderson(x, params)
+        if self.method == "steady_state":
+            return self._steady_state(x, params)
+        return self._newton(x, params)
+
+    def _step(self, x, params):
+        # one generation in place; returns the residual Phi(s) - s and the
+        # temperature change the next generation would bring
+        F, rat, em_p, sig = params[:4]
+        s = np.array([x["Sw"], x["Sb"]])
+        calc.StepState(x, *params)
+        g = np.array([x["Sw"], x["Sb"]])
+        dT = abs(planet_temp(x["Ap"], F, rat, em_p, sig) - x["Tp"])
+        return g - s, dT
+
+    def _anderson(self, x, params):
+        # Anderson acceleration (type II) of the fixed-point iteration on s.
+        # An extrapolated point is only used if it moves the same way as the
+        # plain step; otherwise (e.g. while the daisies are still growing away
+        # from the trivial, unstable root s = 0) the history is restarted.
+        minarea, Albedo = params[7], params[5]
+        dfs, dgs = [], []
+        f_old = g_old = None
+        n = 0
+        while True:
+            s = np.array([x["Sw"], x["Sb"]])
+            f, dT = self._step(x, params)
+            n += 1
+            if dT <= self.tol or n >= self.max_iter:
+                return n, dT
+            g = s + f
+            if f_old is not None:
+                dfs.append(f - f_old)
+                dgs.append(g - g_old)
+                del dfs[: -self.depth], dgs[: -self.depth]
+            f_old, g_old = f, g
+            if dfs:
+                gamma = np.linalg.lstsq(np.array(dfs).T, f, rcond=None)[0]
+                s_new = g - np.array(dgs).T @ gamma
+                if np.dot(s_new - s, f) > 0:
+                    set_areas(x, s_new, minarea, Albedo)
+                else:
+                    dfs, dgs = [], []
+
+    def _newton(self, x, params):
+        # Newton iteration on the residual f(s) = Phi(s) - s. A Newton step is
+        # only taken where the Jacobian of f is stable (eigenvalues with
+        # negative real part), so that it heads for the equilibrium the time
+        # stepping would settle on; elsewhere a plain step is taken.
+        minarea, Albedo = params[7], params[5]
+        scratch = dict(x)
+        eps = 1e-7
+        n = 0
+        while True:
+            s = np.array([x["Sw"], x["Sb"]])
+            f, dT = self._step(x, params)
+            n += 1
+            if dT <= self.tol or n >= self.max_iter:
+                return n, dT
+
+            # finite-difference Jacobian of the residual, for living species
+            J = -np.eye(2)
+            for j in range(2):
+                if s[j] == 0:
+                    continue
+                ds = s.copy()
+                ds[j] += eps
+                scratch.update(x)
+                scratch["Sw"], scratch["Sb"] = s
+                set_areas(scratch, ds, minarea, Albedo)
+                fj, _ = self._step(scratch, params)
+                n += 1
+                J[:, j] = (fj - f) / eps
+            if np.any(np.linalg.eigvals(J).real >= 0):
+                continue
+            # damp the step until the areas stay physical
+            ds = -np.linalg.solve(J, f)
+            alive = s > 0
+            step = 1.0
+            while step > 1e-3:
+                s_new = s + step * ds
+                if np.all(s_new[alive] >= minarea) and s_new.sum() <= 1:
+                    break
+                step /= 2
+            else:
+                continue
+            set_areas(x, s_new, minarea, Albedo)
+
+    def _steady_state(self, x, params):
+        # plain steps first, for up to STEADY_AFTER generations: most
+        # equilibria settle within a few, exactly as with fixed_point. A state
+        # whose temperature still moves steadily one way after them (daisies
+        # spreading or dying off) jumps to the nearest stable steady state
+        # that way, if plain steps confirm it within STEADY_CONFIRM
+        # generations. Otherwise (no such steady state, oscillations, a limit
+        # cycle) the plain steps carry on from where they were, again as with
+        # fixed_point.
+        F, rat, em_p, sig, ins_p, Albedo = params[:6]
+        budget = min(STEADY_AFTER, self.max_iter)
+        temps = [x["Tp"]]
+        n, dT = 0, 2
+        while dT > self.tol and n < budget:
+            calc.StepState(x, *params)
+            n += 1
+            dT = abs(temps[-1] - x["Tp"])
+            temps.append(x["Tp"])
+        if dT <= self.tol or n >= self.max_iter:
+            return n, dT
+        # (the first step also takes up the change of the flux)
+        way = np.sign(np.diff(temps[1:]))
+        if np.all(way == way[0]):
+            found = []
+            for s in steady_states(x, *params, monotone=True):
+                y = steady_state(s, F, rat, em_p, sig, ins_p, Albedo)
+                if np.sign(y["Tp"] - x["Tp"]) == way[0]:
+                    found.append(y)
+            if found:
+                y = min(
+                    found,
+                    key=lambda y: (y["Sw"] - x["Sw"]) ** 2 + (y["Sb"] - x["Sb"]) ** 2,
+                )
+                m, dT = calc.RelaxState(
+                    y, *params, tol=self.tol, max_iter=STEADY_CONFIRM
+                )
+                if dT <= self.tol:
+                    x.update(y)
+                    return n + m, dT
+        m, dT = calc.RelaxState(x, *params, tol=self.tol, max_iter=self.max_iter - n)
+        return n + m, dT
@@ -0,0 +1,78 @@
+# file executor.py
+
+# Parallel executor for sweeps. Independent pieces of work -- whole sweeps of
+# different parameter sets (solve_many, e.g. the lookup table of lookup.py) or
+# chunks of a batched solve (solve_batch, e.g. the command line runner of
+# daisyworld.py and the tiles of phase.py) -- are farmed out to a process pool,
+# and results always come back in submission order. With max_workers=1, or
+# where no process pool can be started, everything runs serially in this
+# process.
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+import batch
+
+
+class SweepExecutor:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pool = None
+        if self.max_workers > 1:
+            try:
+                self.pool = ProcessPoolExecutor(self.max_workers)
+            except (OSError, NotImplementedError, ImportError):
+                # e.g. no working multiprocessing semaphores: run serially
+                self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def submit(self, fn, *args, **kwargs):
+        # a future for fn(*args, **kwargs); computed right away when serial
+        if self.pool is not None:
+            return self.pool.submit(fn, *args, **kwargs)
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+    def map(self, fn, kwargs_list):
+        # [fn(**kwargs) for kwargs in kwargs_list], evaluated in parallel
+        futures = [self.submit(fn, **kwargs) for kwargs in kwargs_list]
+        return [future.result() for future in futures]
+
+    def solve_many(self, solve, params_list, **options):
+        # [solve(**params, **options) for params in params_list], in parallel
+        return self.map(solve, [dict(params, **options) for params in params_list])
+
+    def solve_batch(self, solve_batch, params, chunk_size=500, **options):
+        # run a batched solver (e.g. batch.update_equi_flux_batch) on chunks
+        # of the N parameter sets in parallel and join the results. State
+        # arrays (the result, or the arrays of a result tuple) are joined
+        # along their last (planet) axis.
+        params, n = batch.broadcast_params(**params)
+        chunks = [
+            dict(batch.take_params(params, slice(start, start + chunk_size)), **options)
+            for start in range(0, n, chunk_size)
+        ]
+        results = self.map(solve_batch, chunks)
+        if isinstance(results[0], np.ndarray):
+            return np.concatenate(results, axis=-1)
+        return tuple(
+            (
+                np.concatenate(parts, axis=-1)
+                if isinstance(parts[0], np.ndarray)
+                else parts[0]
+            )
+            for parts in zip(*results)
+        )
@@ -0,0 +1,136 @@
+# file kernels.py
+
+# Fused generation loop of the equilibrium search, the "numba" backend of
+# calc.RelaxState. One generation (temperatures, daisy growth, areas, albedo:
+# calc.UpdateTemp, UpdateAreas and UpdateAlbedo) is a handful of scalar updates
+# of a flat float64 state in calc.STATE_VARS order, done with the same
+# operations in the same order as the functions in calculations.py, so the
+# results agree with the "python" backend to rounding. The loop is compiled
+# with Numba (@njit) when it is installed; otherwise it runs as plain Python,
+# which still avoids the dictionary look-ups and NumPy scalar calls.
+#
+# Select it with calc.set_backend("numba") or DAISYWORLD_BACKEND=numba.
+
+import math
+import warnings
+
+import numpy as np
+
+import calculations as calc
+
+
+def relax_kernel(x, p, tol, max_iter):
+    # relax the state x (Sw, Sb, Su, Ap, Tp, Tw, Tb) in place at the
+    # parameters p (see pack_params); returns the generations stepped and the
+    # last temperature change, as calc.RelaxState
+    F, rat, em_p, sig, ins_p = p[0], p[1], p[2], p[3], p[4]
+    Aw, Ab, An = p[5], p[6], p[7]
+    death_w, death_b, minarea = p[8], p[9], p[10]
+    Tmin_w, Tmin_b, Topt_w, Topt_b = p[11], p[12], p[13], p[14]
+    Sw, Sb, Su, Ap, Tp, Tw, Tb = x[0], x[1], x[2], x[3], x[4], x[5], x[6]
+
+    dT = 2.0
+    n = 0
+    temp = Tp
+    while dT > tol and n < max_iter:
+        # temperatures (UpdateTemp)
+        Fp = F * (1 - Ap) * rat / em_p
+        Tp = math.sqrt(math.sqrt(Fp / sig))
+        Fw = F * (1 - Aw) * rat / em_p
+        Tw = math.sqrt(math.sqrt((ins_p * (Fw - Fp) + Fp) / sig))
+        Fb = F * (1 - Ab) * rat / em_p
+        Tb = math.sqrt(math.sqrt((ins_p * (Fb - Fp) + Fp) / sig))
+
+        # growth and areas (DaisyGrowth, UpdateAreas); both species grow
+        # into the barren area of the previous generation
+        grwth = 1 - ((Tw - Topt_w) / (Tmin_w - Topt_w)) ** 2
+        if grwth < 0:
+            grwth = 0.0
+        if Sw > 0:
+            Sw += Sw * (grwth * Su - death_w)
+            if Sw < minarea:
+                Sw = minarea
+        grwth = 1 - ((Tb - Topt_b) / (Tmin_b - Topt_b)) ** 2
+        if grwth < 0:
+            grwth = 0.0
+        if Sb > 0:
+            Sb += Sb * (grwth * Su - death_b)
+            if Sb < minarea:
+                Sb = minarea
+        Su = 1 - Sw - Sb
+
+        # albedo (UpdateAlbedo)
+        Ap = An * Su + Aw * Sw + Ab * Sb
+
+        n += 1
+        dT = abs(temp - Tp)
+        temp = Tp
+
+    x[0], x[1], x[2], x[3], x[4], x[5], x[6] = Sw, Sb, Su, Ap, Tp, Tw, Tb
+    return n, dT
+
+
+def pack_params(F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt):
+    # the parameters of one relaxation as the flat sequence relax_kernel takes
+    return [
+        float(F),
+        float(rat),
+        float(em_p),
+        float(sig),
+        float(ins_p),
+        float(Albedo["w"]),
+        float(Albedo["b"]),
+        float(Albedo["none"]),
+        float(death["w"]),
+        float(death["b"]),
+        float(minarea),
+        float(T_min["w"]),
+        float(T_min["b"]),
+        float(T_opt["w"]),
+        float(T_opt["b"]),
+    ]
+
+
+_compiled = []
+
+
+def compiled_kernel():
+    # relax_kernel compiled with Numba (on first use), or None without Numba
+    if not _compiled:
+        try:
+            import numba
+        except ImportError:
+            warnings.warn("numba is not installed; running the fused kernel uncompiled")
+            _compiled.append(None)
+        else:
+            _compiled.append(numba.njit(cache=True)(relax_kernel))
+    return _compiled[0]
+
+
+def relax_state(
+    x,
+    F,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    Albedo,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    tol=calc.EQUI_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+):
+    # calc.RelaxState on the fused kernel: same signature and return value
+    p = pack_params(F, rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+    state = [float(x[name]) for name in calc.STATE_VARS]
+    kernel = compiled_kernel()
+    if kernel is None:
+        n, dT = relax_kernel(state, p, float(tol), int(max_iter))
+    else:
+        state = np.array(state)
+        n, dT = kernel(state, np.array(p), float(tol), int(max_iter))
+    for name, value in zip(calc.STATE_VARS, state):
+        x[name] = float(value)
+    return int(n), float(dT)
@@ -0,0 +1,318 @@
+# file lookup.py
+
+# Precomputed lookup table for the Tab 2 slider grid of app.py. The sliders move
+# in discrete steps, so every reachable varying-flux sweep can be solved offline
+# (with the options Tab 2 solves it with) and stored in compact float32 .npy
+# files. The app memory-maps the files at startup, so a callback becomes a pure
+# array lookup and all gunicorn workers share one page-cached copy. (Tab 1 runs
+# in the browser, see assets/daisyworld.js, so it needs no table.)
+#
+# Build the table (into ./tables) with:
+#   python lookup.py build
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+import calculations as calc
+from executor import SweepExecutor
+
+# slider grids as (min, step, count); these mirror the Tab 2 sliders in app.py
+SLIDER_AXES = {
+    "Aw": (0.5, 0.05, 11),  # white daisy albedo
+    "Ab": (0.0, 0.05, 11),  # black daisy albedo
+    "An": (0.3, 0.01, 41),  # soil albedo
+    "ins_p": (0.0, 0.05, 11),  # insulation factor
+}
+
+# the axes of each experiment
+EXPERIMENT_AXES = {
+    "equi_flux": ["Aw", "Ab", "An", "ins_p"],
+}
+
+# the sweeps stored by default: those Tab 2 of app.py shows (tab2_options
+# there). A table only answers for the options it was built with.
+EQUI_FLUX_OPTIONS = {"passes": ("forward", "barren", "backward"), "adaptive": True}
+
+# the field of a calc.EquiFluxResult holding each pass
+PASS_FIELDS = dict(zip(calc.EQUI_PASSES, ("xeq", "xeqbar", "xeqinv")))
+
+# stored states: the daisy areas and the planet temperature, rounded to single
+# precision; the rest of the state vector follows from them (expand_states)
+table_dtype = np.dtype([(name, np.float32) for name in ("Sw", "Sb", "Tp")])
+
+
+def axis_values(axis):
+    start, step, count = SLIDER_AXES[axis]
+    return np.round(start + step * np.arange(count), 10)
+
+
+def slider_values(params):
+    # slider positions corresponding to an app parameter dict
+    return {
+        "Aw": params["Albedo"]["w"],
+        "Ab": params["Albedo"]["b"],
+        "An": params["Albedo"]["none"],
+        "ins_p": params["ins_p"],
+    }
+
+
+def fixed_params(params):
+    # the parameters which are not on a slider; a table is only valid for the
+    # values it was built with
+    fixed = dict(params)
+    for key in ("Albedo", "ins_p"):
+        fixed.pop(key)
+    return fixed
+
+
+def grid_params(init_vars, axes, flat_index, shape):
+    # (batched) parameter dict for the grid points flat_index
+    idx = np.unravel_index(flat_index, shape)
+    values = {axis: axis_values(axis)[i] for axis, i in zip(axes, idx)}
+    params = dict(init_vars)
+    params["Albedo"] = {"w": values["Aw"], "b": values["Ab"], "none": values["An"]}
+    params["ins_p"] = values["ins_p"]
+    return params
+
+
+def expand_states(rows, F, params):
+    # the full state vectors (calc.state_dtype) of the table rows at the
+    # fluxes F (W m-2): the barren area and albedo follow from the daisy
+    # areas, and the local temperatures from the planet temperature, which
+    # was computed from the same outgoing flux (calc.UpdateTemp)
+    x = calc.new_states(rows.shape)
+    for field in table_dtype.names:
+        x[field] = rows[field]
+    x["Su"] = 1 - x["Sw"] - x["Sb"]
+    calc.UpdateAlbedo(x, params["Albedo"])
+    Fp = params["sig"] * x["Tp"] ** 4
+    for species in ("w", "b"):
+        Fs = F * (1 - params["Albedo"][species]) * params["rat"] / params["em_p"]
+        x["T" + species] = np.sqrt(
+            np.sqrt((params["ins_p"] * (Fs - Fp) + Fp) / params["sig"])
+        )
+    return x
+
+
+def sweep_options(options):
+    # the options of calc.solve_equi_flux which shape a sweep, with their
+    # defaults filled in (as stored in the table description)
+    return {
+        "passes": [
+            p for p in calc.EQUI_PASSES if p in options.get("passes", calc.EQUI_PASSES)
+        ],
+        "adaptive": bool(options.get("adaptive", False)),
+        "nt": int(options.get("nt", calc.EQUI_NT)),
+    }
+
+
+def table_rows(result, passes):
+    # the states of the passes of a calc.EquiFluxResult as table rows: one row
+    # per flux, with a column per pass
+    states = np.stack([getattr(result, PASS_FIELDS[p]) for p in passes], axis=1)
+    rows = np.empty(states.shape, dtype=table_dtype)
+    for field in table_dtype.names:
+        rows[field] = states[field]
+    return rows
+
+
+class RowWriter:
+    # appends rows to a .npy file whose length is only known at the end: they
+    # are streamed into a raw temporary file, which close() copies under the
+    # .npy header into path + ".new" (see publish)
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.nrows = 0
+        self.raw = open(path + ".tmp", "wb")
+
+    def write(self, rows):
+        self.raw.write(np.ascontiguousarray(rows, dtype=self.dtype).tobytes())
+        self.nrows += len(rows)
+
+    def close(self):
+        self.raw.close()
+        header = {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self.nrows,) + self.row_shape,
+        }
+        with open(self.path + ".new", "wb") as outfile:
+            np.lib.format.write_array_header_1_0(outfile, header)
+            with open(self.path + ".tmp", "rb") as infile:
+                shutil.copyfileobj(infile, outfile)
+        os.remove(self.path + ".tmp")
+
+
+def publish(paths):
+    # move the files written as path + ".new" into place, in the order given,
+    # after removing the last path (the index load_table looks for): a worker
+    # starting meanwhile finds no table rather than a mix of old and new
+    # files, and workers which have the old files memory-mapped keep them
+    try:
+        os.remove(paths[-1])
+    except FileNotFoundError:
+        pass
+    for path in paths:
+        os.replace(path + ".new", path)
+
+
+def build_table(directory, name, init_vars, options=None, chunk_size=2000, workers=1):
+    # solve the sweep calc.solve_equi_flux(**options) (by default the sweeps
+    # of Tab 2, EQUI_FLUX_OPTIONS) at every grid point of experiment name,
+    # chunk by chunk on up to workers processes. An adaptive sweep visits
+    # fluxes of its own, so the rows of all grid points are stored one after
+    # the other: the states in directory/name.npy (a column per pass), their
+    # flux fractions in name_F.npy and the first row of every grid point in
+    # name_start.npy, with the grid description in name.json.
+    if options is None:
+        options = EQUI_FLUX_OPTIONS
+    options = sweep_options(options)
+    passes = options["passes"]
+    axes = EXPERIMENT_AXES[name]
+    shape = tuple(SLIDER_AXES[axis][2] for axis in axes)
+    npoints = int(np.prod(shape))
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    states = RowWriter(path + ".npy", table_dtype, (len(passes),))
+    fluxes = RowWriter(path + "_F.npy", np.float64)
+    start = np.zeros(npoints + 1, dtype=np.int64)
+    with SweepExecutor(workers) as pool:
+        for first in range(0, npoints, chunk_size):
+            stop = min(first + chunk_size, npoints)
+            results = pool.solve_many(
+                calc.solve_equi_flux,
+                [grid_params(init_vars, axes, i, shape) for i in range(first, stop)],
+                **options
+            )
+            for i, result in enumerate(results, first):
+                states.write(table_rows(result, passes))
+                fluxes.write(np.asarray(result.F))
+                start[i + 1] = start[i] + len(result.F)
+            print("%s: %d/%d" % (name, stop, npoints), flush=True)
+    states.close()
+    fluxes.close()
+    with open(path + "_start.npy.new", "wb") as outfile:
+        np.save(outfile, start)
+
+    info = {
+        "axes": [[axis] + list(SLIDER_AXES[axis]) for axis in axes],
+        "fixed": fixed_params(init_vars),
+        "options": options,
+    }
+    with open(path + ".json.new", "w") as outfile:
+        json.dump(info, outfile, indent=4)
+    publish([path + suffix for suffix in (".json", ".npy", "_F.npy", "_start.npy")])
+
+
+class LookupTable:
+    # a memory-mapped table built by build_table
+
+    def __init__(self, directory, name):
+        self.name = name
+        path = os.path.join(directory, name)
+        with open(path + ".json") as infile:
+            info = json.load(infile)
+        # [[name, min, step, count], ...] of the grid the table was built on
+        self.axes = info["axes"]
+        self.fixed = info["fixed"]
+        self.options = info["options"]
+        self.table = np.load(path + ".npy", mmap_mode="r")
+        self.F = np.load(path + "_F.npy", mmap_mode="r")
+        self.start = np.load(path + "_start.npy")
+
+    def index(self, params):
+        # grid index of params, or None if they are not on the slider grid
+        if fixed_params(params) != self.fixed:
+            return None
+        values = slider_values(params)
+        idx = []
+        for axis, start, step, count in self.axes:
+            i = int(round((values[axis] - start) / step))
+            if not 0 <= i < count or abs(start + i * step - values[axis]) > 1e-6:
+                return None
+            idx.append(i)
+        return tuple(idx)
+
+    def lookup(self, params, **options):
+        # the stored result for the sweep calc.solve_equi_flux(**params,
+        # **options) as a calc.EquiFluxResult, or None if it is not in the
+        # table (also if the table holds sweeps of other options)
+        if sweep_options(options) != self.options:
+            return None
+        idx = self.index(params)
+        if idx is None:
+            return None
+        i = np.ravel_multi_index(idx, [axis[3] for axis in self.axes])
+        rows = self.table[self.start[i] : self.start[i + 1]]
+        F = np.array(self.F[self.start[i] : self.start[i + 1]])
+        Fs = F * params["Fsnom"]
+        fields = dict.fromkeys(PASS_FIELDS.values())
+        for j, name in enumerate(self.options["passes"]):
+            if name == "backward":
+                # xeqinv[i] is the equilibrium at F[i + 1], and the last entry
+                # the end of the forward pass (see calc.solve_equi_flux)
+                fields["xeqinv"] = expand_states(
+                    rows[:, j], np.append(Fs[1:], Fs[-1]), params
+                )
+            else:
+                fields[PASS_FIELDS[name]] = expand_states(rows[:, j], Fs, params)
+        return calc.EquiFluxResult(F=list(F), Fsnom=params["Fsnom"], **fields)
+
+
+def load_table(directory, name):
+    # the table name from directory, or None if it has not been built (its
+    # index of grid points is published last) or is being replaced
+    if not os.path.exists(os.path.join(directory, name + "_start.npy")):
+        return None
+    try:
+        return LookupTable(directory, name)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the slider grid.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default="tables", help="output directory")
+    parser.add_argument(
+        "--experiment",
+        choices=list(EXPERIMENT_AXES),
+        action="append",
+        help="experiment to build (default: all)",
+    )
+    parser.add_argument(
+        "--passes",
+        choices=calc.EQUI_PASSES,
+        action="append",
+        help="pass of the sweeps (default: those of Tab 2)",
+    )
+    parser.add_argument(
+        "--uniform",
+        action="store_true",
+        help="uniform flux steps (default: adaptive, as Tab 2)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes (0: all cores)"
+    )
+    args = parser.parse_args()
+
+    options = dict(EQUI_FLUX_OPTIONS)
+    if args.passes:
+        options["passes"] = args.passes
+    if args.uniform:
+        options["adaptive"] = False
+    with open("init_vars.json") as infile:
+        init_vars = json.load(infile)
+    for name in args.experiment or list(EXPERIMENT_AXES):
+        build_table(
+            args.out, name, init_vars, options, args.chunk_size, args.workers or None
+        )
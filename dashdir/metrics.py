@@ -0,0 +1,263 @@
+# file metrics.py
+
+# Opt-in timing instrumentation, switched on with the environment variable
+# DAISYWORLD_METRICS=1. Each unit of work -- a Dash request, or a background
+# sweep job -- gets a record of the time spent in its stages (table lookup,
+# solve, model, trace building, ...) and of the equilibrium search iterations
+# it ran. Records end up in two places:
+#   * a structured log: one JSON line per record on the "daisyworld" logger
+#   * running totals, served in the Prometheus text format at /metrics
+# For requests, the time not spent in any stage is recorded as the stage
+# "framework" (request decoding, dispatch and JSON serialization by Dash).
+# Totals are per process; with several workers, scrape each one.
+# When switched off, every hook is a no-op.
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+ENABLED = os.environ.get("DAISYWORLD_METRICS", "") not in ("", "0")
+
+# upper bounds (s) of the histogram buckets of the record durations
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger("daisyworld")
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {
+    "stage_count": defaultdict(int),  # (record, stage) -> count
+    "stage_seconds": defaultdict(float),  # (record, stage) -> seconds
+    "record_buckets": defaultdict(lambda: [0] * len(BUCKETS)),  # record -> counts
+    "record_count": defaultdict(int),
+    "record_seconds": defaultdict(float),
+    "iterations": defaultdict(int),  # record -> equilibrium search generations
+    "equilibria": defaultdict(int),  # record -> equilibria found
+}
+
+
+class Record:
+    # the timings of one unit of work
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.fields = {}
+        self.depth = 0
+        self.outer = 0.0  # time spent in outermost stages
+
+
+def current():
+    return getattr(_local, "record", None)
+
+
+def begin(name):
+    # start a record for this thread (replacing any unfinished one)
+    if ENABLED:
+        _local.record = Record(name)
+
+
+def finish(rest=None):
+    # end the record of this thread: log it and add it to the totals. The
+    # time outside of all stages is recorded as the stage rest, if given.
+    record = current()
+    if record is None:
+        return
+    _local.record = None
+    seconds = time.perf_counter() - record.start
+    if rest is not None:
+        record.stages[rest] += max(seconds - record.outer, 0.0)
+    with _lock:
+        for stage, stage_seconds in record.stages.items():
+            _totals["stage_count"][record.name, stage] += 1
+            _totals["stage_seconds"][record.name, stage] += stage_seconds
+        _totals["record_count"][record.name] += 1
+        _totals["record_seconds"][record.name] += seconds
+        buckets = _totals["record_buckets"][record.name]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+        _totals["iterations"][record.name] += record.fields.get("iterations", 0)
+        _totals["equilibria"][record.name] += record.fields.get("equilibria", 0)
+    logger.info(
+        json.dumps(
+            dict(
+                record=record.name,
+                seconds=round(seconds, 6),
+                stages={k: round(v, 6) for k, v in record.stages.items()},
+                **record.fields
+            )
+        )
+    )
+
+
+@contextmanager
+def record(name):
+    # a record for the work done in this block (e.g. a background job)
+    begin(name)
+    try:
+        yield
+    finally:
+        finish()
+
+
+def label(name):
+    # rename the record of this thread (e.g. after the callback it runs)
+    record = current()
+    if record is not None:
+        record.name = name
+
+
+@contextmanager
+def stage(name):
+    # time the block as stage name of the record of this thread
+    record = current()
+    if record is None:
+        yield
+        return
+    record.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        record.depth -= 1
+        record.stages[name] += seconds
+        if record.depth == 0:
+            record.outer += seconds
+
+
+def note(**fields):
+    # attach fields (JSON-able) to the record of this thread
+    record = current()
+    if record is not None:
+        record.fields.update(fields)
+
+
+def solved(result):
+    # note the convergence diagnostics of a freshly solved result, if any
+    record = current()
+    iterations = getattr(result, "iterations", None)
+    if record is None or iterations is None:
+        return
+    done = iterations[iterations > 0]
+    record.fields["iterations"] = record.fields.get("iterations", 0) + int(done.sum())
+    record.fields["equilibria"] = record.fields.get("equilibria", 0) + done.size
+    record.fields["max_iterations"] = max(
+        record.fields.get("max_iterations", 0), int(done.max(initial=0))
+    )
+
+
+def params_fields(params):
+    # the slider parameters of a parameter dict, for the log
+    return {
+        "Aw": params["Albedo"]["w"],
+        "Ab": params["Albedo"]["b"],
+        "An": params["Albedo"]["none"],
+        "ins_p": params["ins_p"],
+        "Fsnom": round(float(np.asarray(params["Fsnom"])), 3),
+    }
+
+
+def render(extra=None):
+    # the totals in the Prometheus text exposition format; extra is a dict
+    # of further gauges {name: (help, value)}
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, kind))
+
+    with _lock:
+        family(
+            "daisyworld_stage_seconds",
+            "summary",
+            "Time spent per stage of each record (request or job).",
+        )
+        for (name, stage_name), seconds in sorted(_totals["stage_seconds"].items()):
+            labels = '{record="%s",stage="%s"}' % (name, stage_name)
+            lines.append("daisyworld_stage_seconds_sum%s %.6f" % (labels, seconds))
+            lines.append(
+                "daisyworld_stage_seconds_count%s %d"
+                % (labels, _totals["stage_count"][name, stage_name])
+            )
+
+        family(
+            "daisyworld_record_seconds",
+            "histogram",
+            "Duration of each record (request or job).",
+        )
+        for name, buckets in sorted(_totals["record_buckets"].items()):
+            for bound, count in zip(BUCKETS, buckets):
+                lines.append(
+                    'daisyworld_record_seconds_bucket{record="%s",le="%g"} %d'
+                    % (name, bound, count)
+                )
+            count = _totals["record_count"][name]
+            lines.append(
+                'daisyworld_record_seconds_bucket{record="%s",le="+Inf"} %d'
+                % (name, count)
+            )
+            lines.append(
+                'daisyworld_record_seconds_sum{record="%s"} %.6f'
+                % (name, _totals["record_seconds"][name])
+            )
+            lines.append(
+                'daisyworld_record_seconds_count{record="%s"} %d' % (name, count)
+            )
+
+        family(
+            "daisyworld_equi_iterations_total",
+            "counter",
+            "Generations stepped by the equilibrium search.",
+        )
+        for name, count in sorted(_totals["iterations"].items()):
+            lines.append(
+                'daisyworld_equi_iterations_total{record="%s"} %d' % (name, count)
+            )
+        family(
+            "daisyworld_equilibria_total",
+            "counter",
+            "Equilibria found by the equilibrium search.",
+        )
+        for name, count in sorted(_totals["equilibria"].items()):
+            lines.append('daisyworld_equilibria_total{record="%s"} %d' % (name, count))
+
+    for name, (help_text, value) in sorted((extra or {}).items()):
+        family(name, "gauge", help_text)
+        lines.append("%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+
+def instrument(server, paths, extra=None):
+    # record the requests to the Flask server whose path is in paths (named
+    # after the path until a callback labels them) and serve the totals at
+    # /metrics; extra() returns further gauges for render. No-op if disabled.
+    if not ENABLED:
+        return
+    import flask
+
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    @server.before_request
+    def begin_request():
+        if flask.request.path in paths:
+            begin(flask.request.path)
+
+    @server.teardown_request
+    def finish_request(exc):
+        finish(rest="framework")
+
+    @server.route("/metrics")
+    def serve_metrics():
+        text = render(extra() if extra is not None else None)
+        return flask.Response(text, mimetype="text/plain; version=0.0.4")
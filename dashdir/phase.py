@@ -0,0 +1,358 @@
+# file phase.py
+
+# Phase diagrams: which daisy species survive, and how warm the planet is, over
+# a grid of two or three parameters (e.g. the black daisy albedo against the
+# solar flux). Every grid point is a planet seeded with both daisies and run to
+# its equilibrium at constant flux, independently of the others, so the grid
+# is cut into tiles of tile_size points, each solved as one batch (batch.py),
+# several tiles at a time (SweepExecutor.solve_batch). Every finished tile is
+# written to disk straight away, keyed on the parameter hash, so an interrupted
+# run picks up from the tiles already there and the app never solves a diagram
+# twice. Only the KEEP_DIAGRAMS most recently used diagrams are kept.
+#
+# The diagram is compact: one byte for the surviving species and single
+# precision for the equilibrium temperature and daisy areas, 13 bytes a point.
+#
+# Build a diagram from the command line (into phase.npy and phase.json) with:
+#   python phase.py build --axis Ab --axis F
+# where an axis is a name of AXES, optionally with its grid as name:min:step:count.
+
+import argparse
+import functools
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+import batch
+import cache
+import calculations as calc
+from executor import SweepExecutor
+
+# default grids of the axes as (min, step, count); F is the solar flux as a
+# fraction of the nominal flux, over the range of the varying flux experiment
+AXES = {
+    "Aw": (0.5, 0.01, 51),  # white daisy albedo
+    "Ab": (0.0, 0.01, 51),  # black daisy albedo
+    "An": (0.3, 0.01, 41),  # soil albedo
+    "ins_p": (0.0, 0.01, 51),  # insulation factor
+    "F": (calc.FRAC_MIN, 0.01, 106),  # solar flux
+}
+
+LABELS = {
+    "Aw": "White daisy albedo",
+    "Ab": "Black daisy albedo",
+    "An": "Soil albedo",
+    "ins_p": "Insulation factor",
+    "F": "Solar flux (fraction of nominal)",
+}
+
+# the surviving species of a grid point, by their code in the diagram: 1 if
+# the white daisies survive plus 2 if the black ones do
+SPECIES = ("none", "white", "black", "both")
+
+# the equilibrium of every grid point
+phase_dtype = np.dtype(
+    [("species", np.uint8), ("Tp", np.float32), ("Sw", np.float32), ("Sb", np.float32)]
+)
+
+TILE_SIZE = 1024
+
+# every planet is stepped SPINUP generations and then relaxed to PHASE_TOL K:
+# seeded daisies change the temperature only slowly at first, so relaxing
+# straight away (as calc.RelaxState does) would stop after a generation
+SPINUP = 300
+PHASE_TOL = 1e-5
+
+# diagrams kept on disk: opening a diagram removes the least recently used
+# ones beyond this many
+KEEP_DIAGRAMS = 32
+
+# values: the phase_dtype equilibria of the grid, one array dimension per
+# axis; axes: [[name, min, step, count], ...] of the grid
+PhaseDiagram = namedtuple("PhaseDiagram", ["values", "axes"])
+
+
+def axis_entry(axis):
+    # [name, min, step, count] of an axis given by its name (on the grid of
+    # AXES) or in full
+    name = axis if isinstance(axis, str) else axis[0]
+    if name not in AXES:
+        raise ValueError("unknown phase diagram axis %r" % name)
+    if isinstance(axis, str):
+        return [name] + list(AXES[name])
+    return list(axis)
+
+
+def axis_values(axis):
+    _, start, step, count = axis
+    return np.round(start + step * np.arange(count), 10)
+
+
+def grid_params(params, axes, flat_index):
+    # parameter dict of the grid points flat_index (to be batched), with their
+    # solar flux as the fraction F of the nominal flux
+    shape = tuple(axis[3] for axis in axes)
+    idx = np.unravel_index(flat_index, shape)
+    values = {axis[0]: axis_values(axis)[i] for axis, i in zip(axes, idx)}
+    params = dict(params)
+    params["Albedo"] = dict(params["Albedo"])
+    for name, species in (("Aw", "w"), ("Ab", "b"), ("An", "none")):
+        if name in values:
+            params["Albedo"][species] = values[name]
+    if "ins_p" in values:
+        params["ins_p"] = values["ins_p"]
+    params["F"] = values.get("F", 1.0)
+    return params
+
+
+def survivors(x, minarea):
+    # species code of the states x: a dying species is held at minarea, so a
+    # species survives where it covers more than twice that
+    return (x["Sw"] > 2 * minarea) + 2 * (x["Sb"] > 2 * minarea)
+
+
+def solve_points(
+    F,
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    spinup=SPINUP,
+    tol=PHASE_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+):
+    # batched solver of the grid points (see grid_params): the equilibria of
+    # the planets at the flux fractions F, seeded with both daisies, as
+    # phase_dtype rows
+    p, n = batch.broadcast_params(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    F = F * p["Fsnom"]
+    x = batch.initial_states(F, p, {"w": 0.01, "b": 0.01})
+    for g in range(spinup):
+        batch.StepStates(x, F, p)
+    batch.RelaxStates(x, F, p, tol, max_iter)
+
+    rows = np.empty(n, dtype=phase_dtype)
+    rows["species"] = survivors(x, p["minarea"])
+    for name in ("Tp", "Sw", "Sb"):
+        rows[name] = x[name]
+    return rows
+
+
+class TileStore:
+    # the finished tiles of one diagram, one .npy file each in directory/key,
+    # replaced atomically
+
+    def __init__(self, directory, key):
+        self.root = directory
+        self.directory = os.path.join(directory, key)
+        os.makedirs(self.directory, exist_ok=True)
+        # the modification time of a diagram is its last use
+        os.utime(self.directory)
+        self.prune()
+
+    def path(self, i):
+        return os.path.join(self.directory, "tile_%d.npy" % i)
+
+    def write(self, i, rows):
+        # (another process may have pruned the diagram meanwhile)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as outfile:
+            np.save(outfile, rows)
+        os.replace(tmp, self.path(i))
+
+    def read(self, i):
+        # the rows of tile i, or None if it has not been solved
+        try:
+            return np.load(self.path(i), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+
+    def prune(self, keep=KEEP_DIAGRAMS):
+        # remove all but the keep most recently used diagrams
+        used = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                used.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        used.sort(reverse=True)
+        for _, path in used[keep:]:
+            if path != self.directory:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def phase_diagram(
+    axes,
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    tile_size=TILE_SIZE,
+    workers=1,
+    directory=None,
+    spinup=SPINUP,
+    tol=PHASE_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+    progress=None,
+):
+    # the PhaseDiagram over the 2 or 3 axes (see axis_entry), the other
+    # parameters as given. Tiles are solved on up to workers processes, one
+    # wave at a time, and kept in directory (if not None), from where a later
+    # call with the same parameters takes them. progress(done, total) is
+    # called with the number of tiles finished.
+    axes = [axis_entry(axis) for axis in axes]
+    if len(axes) not in (2, 3):
+        raise ValueError("a phase diagram has 2 or 3 axes, not %d" % len(axes))
+    params = dict(
+        Fsnom=Fsnom,
+        Albedo=Albedo,
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    shape = tuple(axis[3] for axis in axes)
+    npoints = int(np.prod(shape))
+    tiles = [
+        (start, min(start + tile_size, npoints))
+        for start in range(0, npoints, tile_size)
+    ]
+
+    store = None
+    if directory is not None:
+        solution = dict(spinup=spinup, tol=tol, max_iter=max_iter)
+        key = cache.params_key(
+            "phase_diagram", dict(params, axes=axes, tile_size=tile_size, **solution)
+        )
+        store = TileStore(directory, key)
+
+    values = np.empty(shape, dtype=phase_dtype)
+    rows = values.reshape(npoints)
+    todo = []
+    for i, (start, stop) in enumerate(tiles):
+        tile = store.read(i) if store is not None else None
+        if tile is None:
+            todo.append(i)
+        else:
+            rows[start:stop] = tile
+    done = len(tiles) - len(todo)
+    if progress is not None:
+        progress(done, len(tiles))
+
+    # a wave of tiles is one batched solve with a chunk per tile (only the
+    # last tile of the grid is shorter than tile_size, and it comes last)
+    with SweepExecutor(workers) as pool:
+        for wave in range(0, len(todo), pool.max_workers):
+            wave_tiles = todo[wave : wave + pool.max_workers]
+            index = np.concatenate([np.arange(*tiles[i]) for i in wave_tiles])
+            solved = pool.solve_batch(
+                solve_points,
+                grid_params(params, axes, index),
+                tile_size,
+                spinup=spinup,
+                tol=tol,
+                max_iter=max_iter,
+            )
+            offset = 0
+            for i in wave_tiles:
+                start, stop = tiles[i]
+                tile = solved[offset : offset + stop - start]
+                offset += stop - start
+                rows[start:stop] = tile
+                if store is not None:
+                    store.write(i, tile)
+                done += 1
+                if progress is not None:
+                    progress(done, len(tiles))
+
+    return PhaseDiagram(values, axes)
+
+
+def take_slice(diagram, i):
+    # the 2-D diagram at index i of the third axis of a 3-D diagram
+    return PhaseDiagram(diagram.values[:, :, i], diagram.axes[:2])
+
+
+def solve_phase_diagram(directory, params):
+    # cached phase_diagram(**params), with its tiles kept in directory
+    return cache.results.solve(
+        "phase_diagram",
+        functools.partial(phase_diagram, directory=directory),
+        params,
+    )
+
+
+def parse_axis(text):
+    # an axis of the command line: name or name:min:step:count
+    name, *grid = text.split(":")
+    if not grid:
+        return axis_entry(name)
+    start, step, count = grid
+    return axis_entry([name, float(start), float(step), int(count)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a phase diagram.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument(
+        "--axis",
+        action="append",
+        help="axis %s, or name:min:step:count (default: Ab and F)" % "/".join(AXES),
+    )
+    parser.add_argument("--out", default="phase", help="output file name (no suffix)")
+    parser.add_argument(
+        "--tiles", default="phase_tiles", help="directory of the finished tiles"
+    )
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of processes (0: all cores)"
+    )
+    args = parser.parse_args()
+
+    with open("init_vars.json") as infile:
+        init_vars = json.load(infile)
+    diagram = phase_diagram(
+        [parse_axis(axis) for axis in args.axis or ["Ab", "F"]],
+        **init_vars,
+        tile_size=args.tile_size,
+        workers=args.workers or None,
+        directory=args.tiles,
+        progress=lambda done, total: print("tiles: %d/%d" % (done, total), flush=True),
+    )
+    np.save(args.out + ".npy", diagram.values)
+    info = {"axes": diagram.axes, "species": SPECIES, "params": init_vars}
+    with open(args.out + ".json", "w") as outfile:
+        json.dump(info, outfile, indent=4)
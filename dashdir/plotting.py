@@ -2,6 +2,8 @@ import plotly.graph_objects as go
 import plotly.figure_factory as ff
 import numpy as np
 import calculations as calc
+import ensemble
+import phase
 
 from plotly.subplots import make_subplots
 
@@ -48,19 +50,15 @@ def initialize_albedo_plot(T_min, T_opt):
     return albedo_plot
 
 
-def constant_flux_temp(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-):
+def constant_flux_temp_traces(result):
+    # x values and the y values of each trace of constant_flux_temp
+    xgens, gens = result.xgens, result.gens
+    return gens, [xgens["Tw"] - 273.15, xgens["Tb"] - 273.15, xgens["Tp"] - 273.15]
 
-    # initial areas are embedded in here but should be passed in as an
-    # argument later if we want to change the initial conditions
-    # externally...
-    areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
 
-    # solve the constant flux problem:
-    xgens, gens = calc.update_constant_flux(
-        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas
-    )
+def constant_flux_temp(result):
+    # build the figure from a solved calc.ConstantFluxResult
+    gens, (Tw, Tb, Tp) = constant_flux_temp_traces(result)
 
     # temperatures plot
     fig = go.Figure()
@@ -80,7 +78,7 @@ def constant_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[x["Tw"] - 273.15 for x in xgens],
+            y=Tw,
             name="White daisies temperature",
             line=dict(color="lavender", width=8),
         )
@@ -88,7 +86,7 @@ def constant_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[x["Tb"] - 273.15 for x in xgens],
+            y=Tb,
             name="Black daisies temperature",
             line=dict(color="black", width=3),
         )
@@ -96,7 +94,7 @@ def constant_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[x["Tp"] - 273.15 for x in xgens],
+            y=Tp,
             name="Planet temperature",
             line=dict(color="seagreen", width=5, dash="dot"),
         )
@@ -113,19 +111,15 @@ def constant_flux_temp(
     return fig
 
 
-def constant_flux_area(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-):
+def constant_flux_area_traces(result):
+    # x values and the y values of each trace of constant_flux_area
+    xgens, gens = result.xgens, result.gens
+    return gens, [100 * xgens["Sw"], 100 * xgens["Sb"], 100 * xgens["Su"], xgens["Ap"]]
 
-    # initial areas are embedded in here but should be passed in as an
-    # argument later if we want to change the initial conditions
-    # externally...
-    areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
 
-    # solve the constant flux problem:
-    xgens, gens = calc.update_constant_flux(
-        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, areas
-    )
+def constant_flux_area(result):
+    # build the figure from a solved calc.ConstantFluxResult
+    gens, (Sw, Sb, Su, Ap) = constant_flux_area_traces(result)
 
     # make the figure:
     fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -146,7 +140,7 @@ def constant_flux_area(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[100 * x["Sw"] for x in xgens],
+            y=Sw,
             name="White daisies area",
             line=dict(color="lavender", width=8),
         ),
@@ -155,7 +149,7 @@ def constant_flux_area(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[100 * x["Sb"] for x in xgens],
+            y=Sb,
             name="Black daisies area",
             line=dict(color="black", width=3),
         ),
@@ -164,7 +158,7 @@ def constant_flux_area(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[100 * x["Su"] for x in xgens],
+            y=Su,
             name="Uninhabited area",
             line=dict(color="saddlebrown", width=4),
         ),
@@ -173,7 +167,7 @@ def constant_flux_area(
     fig.add_trace(
         go.Scatter(
             x=gens,
-            y=[x["Ap"] for x in xgens],
+            y=Ap,
             name="Combined albedo",
             line=dict(color="royalblue", dash="dash"),
         ),
@@ -193,19 +187,38 @@ def constant_flux_area(
     return fig
 
 
-def varying_solar_flux_temp(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-):
-    xeq, xeqbar, _, F = calc.update_equi_flux(
-        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-    )
-    # fig = go.Figure(data=go.Scatter(x=F, y=[x["Tw"] - 273.15 for x in xeq]))
+def varying_solar_flux_temp_traces(result):
+    # x values and the y values of each trace of varying_solar_flux_temp
+    xeq, xeqbar, F, Fsnom = result.xeq, result.xeqbar, result.F, result.Fsnom
+    # make a list of arbitrary times to plot against (the flux grows by one
+    # step of the default flux grid per unit of time)
+    times = calc.flux_times(F)
+    return times, [
+        np.asarray(F) * Fsnom,
+        xeq["Tw"] - 273.15,
+        xeq["Tb"] - 273.15,
+        xeq["Tp"] - 273.15,
+        xeqbar["Tp"] - 273.15,
+    ]
+
+
+def tipping_traces(tipping, branch="forward"):
+    # x (simulation time) and y (planet temperature halfway through the jump)
+    # of the tipping points of one sweep of a tipping.TippingResult
+    points = [p for p in tipping.points if p.branch == branch]
+    times = calc.flux_times([p.F for p in points])
+    Tp = [(p.before["Tp"] + p.after["Tp"]) / 2 - 273.15 for p in points]
+    return times, Tp
+
+
+def varying_solar_flux_temp(result, tipping=None):
+    # build the figure from a solved calc.EquiFluxResult, with the tipping
+    # points of the forward sweep from a tipping.TippingResult (none if None)
+    times, (flux, Tw, Tb, Tp, Tbar) = varying_solar_flux_temp_traces(result)
+    # fig = go.Figure(data=go.Scatter(x=F, y=xeq["Tw"] - 273.15))
     ##
     # # fig = make_subplots(rows=1, cols=2, subplot_titles=("Plot1", "Plot2"))
 
-    # make a list of arbitrary times to plot against
-    times = np.arange(0, len(F) + 1, 1)
-
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     fig.add_hrect(
         xref="paper",
@@ -225,7 +238,7 @@ def varying_solar_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[Fi * Fsnom for Fi in F],
+            y=flux,
             name="Solar flux (right axis)",
             line=dict(color="rgba(255, 255, 0, 0.3)", width=5),
         ),
@@ -234,7 +247,7 @@ def varying_solar_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[x["Tw"] - 273.15 for x in xeq],
+            y=Tw,
             name="White daisies temperature",
             line=dict(color="lavender", width=7),
         ),
@@ -243,7 +256,7 @@ def varying_solar_flux_temp(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Tw"] - 273.15 for x in xeqinv],
+    #         y=xeqinv["Tw"] - 273.15,
     #         name="White daisies temperature (backwards)",
     #         line=dict(color="lightskyblue", dash="dot", width=5),
     #     ),
@@ -251,7 +264,7 @@ def varying_solar_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[x["Tb"] - 273.15 for x in xeq],
+            y=Tb,
             name="Black daisies temperature",
             line=dict(color="black", width=3),
         ),
@@ -260,7 +273,7 @@ def varying_solar_flux_temp(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Tb"] - 273.15 for x in xeqinv],
+    #         y=xeqinv["Tb"] - 273.15,
     #         name="Black daisies temperature (backwards)",
     #         line=dict(color="darkslategray", dash="dot", width=3),
     #     ),
@@ -268,7 +281,7 @@ def varying_solar_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[x["Tp"] - 273.15 for x in xeq],
+            y=Tp,
             name="Planet temperature",
             line=dict(color="seagreen", width=5, dash="dot"),
         ),
@@ -277,7 +290,7 @@ def varying_solar_flux_temp(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Tp"] - 273.15 for x in xeqinv],
+    #         y=xeqinv["Tp"] - 273.15,
     #         name="Planet temperature (backwards)",
     #         line=dict(color="sienna", dash="dot", width=3),
     #     ),
@@ -285,14 +298,27 @@ def varying_solar_flux_temp(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[x["Tp"] - 273.15 for x in xeqbar],
+            y=Tbar,
             name="Planet temperature (without life)",
             line=dict(color="gray", dash="dash", width=3),
         ),
         secondary_y=False,
     )
+    tipping_times, tipping_Tp = ([], []) if tipping is None else tipping_traces(tipping)
+    fig.add_trace(
+        go.Scatter(
+            x=tipping_times,
+            y=tipping_Tp,
+            name="Tipping points",
+            mode="markers",
+            marker=dict(color="red", symbol="x", size=12),
+        ),
+        secondary_y=False,
+    )
 
-    fig.update_xaxes(title="Simulation Time [Myr]", range=[0, times[-1]])
+    fig.update_xaxes(
+        title="Simulation Time [Myr]", range=[0, calc.flux_times(calc.FRAC_MAX)]
+    )
     fig.update_yaxes(
         title="Temperature [degC]",
         range=[-20, 80],
@@ -305,16 +331,24 @@ def varying_solar_flux_temp(
     return fig
 
 
-def varying_solar_flux_area(
-    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-):
-    xeq, _, _, F = calc.update_equi_flux(
-        Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
-    )
+def varying_solar_flux_area_traces(result):
+    # x values and the y values of each trace of varying_solar_flux_area
+    xeq, F, Fsnom = result.xeq, result.F, result.Fsnom
+    # make a list of arbitrary times to plot against (the flux grows by one
+    # step of the default flux grid per unit of time)
+    times = calc.flux_times(F)
+    return times, [
+        np.asarray(F) * Fsnom,
+        100 * xeq["Sw"],
+        100 * xeq["Sb"],
+        100 * xeq["Su"],
+    ]
 
-    # make a list of arbitrary times to plot against
-    times = np.arange(0, len(F) + 1, 1)
-    # fig = go.Figure(data=go.Scatter(x=F, y=[x["Tw"] - 273.15 for x in xeq]))
+
+def varying_solar_flux_area(result):
+    # build the figure from a solved calc.EquiFluxResult
+    times, (flux, Sw, Sb, Su) = varying_solar_flux_area_traces(result)
+    # fig = go.Figure(data=go.Scatter(x=F, y=xeq["Tw"] - 273.15))
     ##
     # # fig = make_subplots(rows=1, cols=2, subplot_titles=("Plot1", "Plot2"))
     fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -336,7 +370,7 @@ def varying_solar_flux_area(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[Fi * Fsnom for Fi in F],
+            y=flux,
             name="Solar flux (right axis)",
             line=dict(color="rgba(255, 255, 0, 0.3)", width=5),
         ),
@@ -345,7 +379,7 @@ def varying_solar_flux_area(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[100 * x["Sw"] for x in xeq],
+            y=Sw,
             name="White daisies area",
             line=dict(color="lavender", width=7),
         ),
@@ -354,7 +388,7 @@ def varying_solar_flux_area(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Sw"] for x in xeqinv],
+    #         y=xeqinv["Sw"],
     #         name="White daisies area (backwards)",
     #         line=dict(color="lightskyblue", dash="dot", width=5),
     #     ),
@@ -362,7 +396,7 @@ def varying_solar_flux_area(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[100 * x["Sb"] for x in xeq],
+            y=Sb,
             name="Black daisies area",
             line=dict(color="black", width=3),
         ),
@@ -371,7 +405,7 @@ def varying_solar_flux_area(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Sb"] for x in xeqinv],
+    #         y=xeqinv["Sb"],
     #         name="Black daisies area (backwards)",
     #         line=dict(color="darkslategray", dash="dot", width=3),
     #     ),
@@ -379,7 +413,7 @@ def varying_solar_flux_area(
     fig.add_trace(
         go.Scatter(
             x=times,
-            y=[100 * x["Su"] for x in xeq],
+            y=Su,
             name="Uninhabited area",
             line=dict(color="saddlebrown", width=3),
         ),
@@ -388,13 +422,15 @@ def varying_solar_flux_area(
     # fig.add_trace(
     #     go.Scatter(
     #         x=F,
-    #         y=[x["Su"] for x in xeqinv],
+    #         y=xeqinv["Su"],
     #         name="Uninhabited area (backwards)",
     #         line=dict(color="sienna", dash="dot", width=3),
     #     ),
     # )
 
-    fig.update_xaxes(title="Simulation Time [Myr]", range=[0, times[-1]])
+    fig.update_xaxes(
+        title="Simulation Time [Myr]", range=[0, calc.flux_times(calc.FRAC_MAX)]
+    )
     fig.update_yaxes(
         title="Inhabited area [%]",
         range=[0, 100],
@@ -404,3 +440,336 @@ def varying_solar_flux_area(
     fig.update_layout(title_text="Equilibrium area vs solar flux")
     fig.update_layout(plot_bgcolor="silver")
     return fig
+
+
+def band(bands, name, scale=1, offset=0):
+    # lower edge, upper edge and median of the entry name of an ensemble's
+    # percentile bands (the first, last and middle percentile)
+    values = bands[name] * scale + offset
+    return [values[0], values[-1], values[len(values) // 2]]
+
+
+def add_band(fig, x, lower, upper, median, name, color, fillcolor, row):
+    # a shaded band between lower and upper with the median on top
+    label = "%g-%g%% of planets" % (ensemble.PERCENTILES[0], ensemble.PERCENTILES[-1])
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=lower,
+            line=dict(width=0),
+            hoverinfo="skip",
+            showlegend=False,
+            legendgroup=name,
+        ),
+        row=row,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=upper,
+            name=name + " (" + label + ")",
+            fill="tonexty",
+            fillcolor=fillcolor,
+            line=dict(width=0),
+            legendgroup=name,
+        ),
+        row=row,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=median,
+            name=name + " (median)",
+            line=dict(color=color, width=3),
+            legendgroup=name,
+        ),
+        row=row,
+        col=1,
+    )
+
+
+def constant_flux_ensemble_traces(result):
+    # x values and the y values of each trace of constant_flux_ensemble
+    xgens, gens = result.xgens, result.gens
+    return gens, (
+        band(xgens, "Tp", offset=-273.15)
+        + band(xgens, "Sw", scale=100)
+        + band(xgens, "Sb", scale=100)
+    )
+
+
+def constant_flux_ensemble(result=None):
+    # build the figure from a solved ensemble.ConstantFluxEnsemble; without a
+    # result the traces are empty, to be filled in with trace_update
+    if result is None:
+        gens, ys = [], [[]] * 9
+    else:
+        gens, ys = constant_flux_ensemble_traces(result)
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08)
+    fig.update_xaxes(showgrid=True, zeroline=False)
+    fig.update_yaxes(showgrid=True, zeroline=False)
+    add_band(
+        fig,
+        gens,
+        *ys[0:3],
+        "Planet temperature",
+        "seagreen",
+        "rgba(46, 139, 87, 0.3)",
+        1,
+    )
+    add_band(
+        fig,
+        gens,
+        *ys[3:6],
+        "White daisies area",
+        "lavender",
+        "rgba(230, 230, 250, 0.5)",
+        2,
+    )
+    add_band(
+        fig, gens, *ys[6:9], "Black daisies area", "black", "rgba(0, 0, 0, 0.3)", 2
+    )
+
+    fig.update_xaxes(title_text="Simulation Time (Daisy generation #)", row=2, col=1)
+    fig.update_xaxes(range=[0, 40])
+    fig.update_yaxes(title_text="Temperature [degC]", range=[10, 40], row=1, col=1)
+    fig.update_yaxes(title_text="Inhabited area [%]", range=[0, 100], row=2, col=1)
+    fig.layout.title = "Constant flux: spread over an ensemble of perturbed planets"
+    fig.update_layout(plot_bgcolor="silver", height=700)
+    return fig
+
+
+def varying_solar_flux_ensemble_traces(result):
+    # x values and the y values of each trace of varying_solar_flux_ensemble
+    xeq, xeqbar = result.xeq, result.xeqbar
+    times = calc.flux_times(result.F)
+    return times, (
+        band(xeq, "Tp", offset=-273.15)
+        + band(xeqbar, "Tp", offset=-273.15)
+        + band(xeq, "Sw", scale=100)
+        + band(xeq, "Sb", scale=100)
+    )
+
+
+def varying_solar_flux_ensemble(result=None):
+    # build the figure from a solved ensemble.EquiFluxEnsemble (with the
+    # forward and barren passes); without a result the traces are empty, to be
+    # filled in with trace_update
+    if result is None:
+        times, ys = [], [[]] * 12
+    else:
+        times, ys = varying_solar_flux_ensemble_traces(result)
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08)
+    fig.update_xaxes(showgrid=True, zeroline=False)
+    fig.update_yaxes(showgrid=True, zeroline=False)
+    add_band(
+        fig,
+        times,
+        *ys[0:3],
+        "Planet temperature",
+        "seagreen",
+        "rgba(46, 139, 87, 0.3)",
+        1,
+    )
+    add_band(
+        fig,
+        times,
+        *ys[3:6],
+        "Planet temperature (without life)",
+        "gray",
+        "rgba(128, 128, 128, 0.3)",
+        1,
+    )
+    add_band(
+        fig,
+        times,
+        *ys[6:9],
+        "White daisies area",
+        "lavender",
+        "rgba(230, 230, 250, 0.5)",
+        2,
+    )
+    add_band(
+        fig, times, *ys[9:12], "Black daisies area", "black", "rgba(0, 0, 0, 0.3)", 2
+    )
+
+    fig.update_xaxes(title_text="Simulation Time [Myr]", row=2, col=1)
+    fig.update_xaxes(range=[0, calc.flux_times(calc.FRAC_MAX)])
+    fig.update_yaxes(title_text="Temperature [degC]", range=[-20, 80], row=1, col=1)
+    fig.update_yaxes(title_text="Inhabited area [%]", range=[0, 100], row=2, col=1)
+    fig.layout.title = (
+        "Varying solar flux: spread over an ensemble of perturbed planets"
+    )
+    fig.update_layout(plot_bgcolor="silver", height=700)
+    return fig
+
+
+def spatial_temp_traces(result):
+    # longitudes, latitudes and the planet temperature of every cell
+    return result.lon, result.lat, result.x["Tp"] - 273.15
+
+
+def spatial_temp(result):
+    # build the heatmap from a solved spatial.SpatialResult
+    lon, lat, Tp = spatial_temp_traces(result)
+    fig = go.Figure(
+        go.Heatmap(
+            x=lon,
+            y=lat,
+            z=compact(Tp, HEATMAP_DECIMALS),
+            zmin=-20,
+            zmax=60,
+            colorscale="RdBu_r",
+            colorbar=dict(title="Temperature [degC]"),
+        )
+    )
+    fig.update_xaxes(title="Longitude [deg]", range=[-180, 180])
+    fig.update_yaxes(title="Latitude [deg]", range=[-90, 90])
+    fig.layout.title = "Planet temperature"
+    return fig
+
+
+def spatial_area_traces(result):
+    # longitudes, latitudes and the white minus the black daisy area of every
+    # cell
+    return result.lon, result.lat, 100 * (result.x["Sw"] - result.x["Sb"])
+
+
+def spatial_area(result):
+    # build the heatmap from a solved spatial.SpatialResult
+    lon, lat, cover = spatial_area_traces(result)
+    fig = go.Figure(
+        go.Heatmap(
+            x=lon,
+            y=lat,
+            z=compact(cover, HEATMAP_DECIMALS),
+            zmin=-100,
+            zmax=100,
+            colorscale=[[0, "black"], [0.5, "saddlebrown"], [1, "white"]],
+            colorbar=dict(title="White - black [%]"),
+        )
+    )
+    fig.update_xaxes(title="Longitude [deg]", range=[-180, 180])
+    fig.update_yaxes(title="Latitude [deg]", range=[-90, 90])
+    fig.layout.title = "Daisy cover (white minus black daisy area)"
+    fig.update_layout(plot_bgcolor="silver")
+    return fig
+
+
+# colours of the surviving species codes of phase.SPECIES: bare soil, white
+# daisies, black daisies and grey where both survive
+PHASE_COLOURS = ["saddlebrown", "white", "black", "grey"]
+
+
+def phase_species_traces(diagram):
+    # values of the first two axes of a phase.PhaseDiagram and the surviving
+    # species of every grid point (one row per value of the second axis)
+    x, y = [phase.axis_values(axis) for axis in diagram.axes[:2]]
+    return x, y, diagram.values["species"].T
+
+
+def phase_species(diagram):
+    # build the heatmap from a 2-D phase.PhaseDiagram
+    x, y, species = phase_species_traces(diagram)
+    n = len(phase.SPECIES)
+    colorscale = []
+    for code, colour in enumerate(PHASE_COLOURS):
+        colorscale += [[code / n, colour], [(code + 1) / n, colour]]
+    fig = go.Figure(
+        go.Heatmap(
+            x=x,
+            y=y,
+            z=species,
+            zmin=-0.5,
+            zmax=n - 0.5,
+            colorscale=colorscale,
+            colorbar=dict(
+                title="Surviving daisies",
+                tickvals=list(range(n)),
+                ticktext=list(phase.SPECIES),
+            ),
+        )
+    )
+    fig.update_xaxes(title=phase.LABELS[diagram.axes[0][0]])
+    fig.update_yaxes(title=phase.LABELS[diagram.axes[1][0]])
+    fig.layout.title = "Phase diagram: which daisies survive"
+    return fig
+
+
+def phase_temp_traces(diagram):
+    # values of the first two axes and the equilibrium planet temperature
+    x, y = [phase.axis_values(axis) for axis in diagram.axes[:2]]
+    return x, y, diagram.values["Tp"].T - 273.15
+
+
+def phase_temp(diagram):
+    # build the heatmap from a 2-D phase.PhaseDiagram
+    x, y, Tp = phase_temp_traces(diagram)
+    fig = go.Figure(
+        go.Heatmap(
+            x=x,
+            y=y,
+            z=compact(Tp, HEATMAP_DECIMALS),
+            zmin=-20,
+            zmax=80,
+            colorscale="RdBu_r",
+            colorbar=dict(title="Temperature [degC]"),
+        )
+    )
+    fig.update_xaxes(title=phase.LABELS[diagram.axes[0][0]])
+    fig.update_yaxes(title=phase.LABELS[diagram.axes[1][0]])
+    fig.layout.title = "Phase diagram: equilibrium planet temperature"
+    return fig
+
+
+# trace data sent by trace_update is rounded to this many decimals, well below
+# what the figures can resolve; short numbers keep the JSON payload small
+TRACE_DECIMALS = 4
+# and heatmap values to this many (a colour scale resolves far less)
+HEATMAP_DECIMALS = 2
+
+
+def compact(values, decimals=TRACE_DECIMALS):
+    # trace values as a NumPy array, with floats rounded to decimals
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        values = np.round(values, decimals)
+    return values
+
+
+def trace_update(traces):
+    # extendData for a dcc.Graph holding one of the figures above, replacing
+    # the data of all its traces by traces = (x, [y, ...]) (as returned by the
+    # *_traces functions): Plotly appends the new points and keeps only the
+    # last len(x) of each trace. The layout in the browser is left alone.
+    # (Plotly's base64 typed arrays need plotly.js >= 2.28, newer than the one
+    # bundled with the pinned Dash, so the arrays are sent as short JSON lists.)
+    x, ys = traces
+    x = compact(x)
+    ys = [compact(y) for y in ys]
+    return [{"x": [x] * len(ys), "y": ys}, list(range(len(ys))), len(x)]
+
+
+def append_trace(update, traces):
+    # add a trace with x values of its own, traces = (x, y), to an extendData
+    # update of trace_update (as the next trace of the figure). It is padded
+    # with NaN (not drawn) to the points kept of every trace.
+    data, indices, npoints = update
+    x, y = traces
+    pad = np.full(npoints - len(x), np.nan)
+    data["x"].append(compact(np.concatenate([x, pad])))
+    data["y"].append(compact(np.concatenate([y, pad])))
+    indices.append(len(indices))
+    return update
+
+
+def heatmap_update(traces):
+    # extendData for a dcc.Graph holding one of the heatmaps above, replacing
+    # its values by those of traces = (x, y, z): the rows of z are appended
+    # and only the last len(y) kept
+    x, y, z = traces
+    return [{"z": [compact(z, HEATMAP_DECIMALS)]}, [0], len(y)]
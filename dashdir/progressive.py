@@ -0,0 +1,226 @@
+# file progressive.py
+
+# Progressive varying flux sweeps for the dashboard. Sweeps on the default
+# flux grid or adaptive ones take some tens of ms and are solved inline. A
+# larger sweep which is not cached yet runs in a background thread and
+# publishes its partial curves as its passes go; the app polls for them
+# (dcc.Interval) and redraws, so the first points show up long before the
+# sweep is done and no request waits for all of it. Jobs live in a directory on local disk (a
+# stand-in for diskcache/Redis), keyed on the parameter hash, so that any
+# worker process can answer the polls. At worst, a job whose worker died is
+# started again. A job whose solve raised is recorded as failed, and reported
+# (JobFailed) rather than started again until its job file is pruned.
+
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import cache
+import calculations as calc
+import metrics
+
+# partial results are written at most this often (s)
+PUBLISH_INTERVAL = 0.2
+# a job which has not published for this long is presumed dead (e.g. its
+# worker was restarted) and may be started again (s)
+STALE_AFTER = 30
+# job files are removed this long after they were last written (s)
+KEEP_FOR = 3600
+# sweeps of at most this many flux steps (and adaptive ones) are solved inline
+INLINE_NT = calc.EQUI_NT
+
+# a job as read from its file: the (partial) calc.EquiFluxResult, whether the
+# job is finished, the time it was last written, and the error message of a
+# failed job (which has no result)
+Job = namedtuple("Job", ["result", "done", "time", "error"], defaults=(None,))
+
+
+class JobFailed(Exception):
+    # the sweep of a job raised; the message is that of the job's error
+    pass
+
+
+def pad_states(states, n):
+    # the state vectors states as an array of n rows, NaN beyond the last one
+    padded = calc.new_states(n)
+    for name in calc.STATE_VARS:
+        padded[name] = np.nan
+    if isinstance(states, np.ndarray):
+        padded[: len(states)] = states
+    else:
+        for i, x in enumerate(states):
+            calc.store_state(padded, i, x)
+    return padded
+
+
+def partial_result(Fsnom, passes, reported):
+    # calc.EquiFluxResult of the points done so far, from the progress reports
+    # {pass name: (F, states)} of calc.solve_equi_flux. All requested passes
+    # get the fluxes of the forward or barren one furthest along (the passes
+    # visit the same fluxes), padded with NaN where they are behind. The
+    # backward pass comes last, once the forward one is done; it runs from
+    # the end, where xeqinv[-1] is the end of the forward pass and xeqinv[i]
+    # the equilibrium at F[i + 1].
+    F = max([reported[name][0] for name in reported if name != "backward"], key=len)
+    fields = {}
+    for field, name in zip(("xeq", "xeqbar", "xeqinv"), calc.EQUI_PASSES):
+        if name not in passes:
+            fields[field] = None
+            continue
+        states = reported[name][1] if name in reported else []
+        if name == "backward":
+            padded = pad_states([], len(F))
+            m = min(len(states), len(F))
+            padded[len(F) - m :][::-1] = states[:m]
+            fields[field] = padded
+        else:
+            fields[field] = pad_states(states, len(F))
+    return calc.EquiFluxResult(F=list(F), Fsnom=Fsnom, **fields)
+
+
+class JobStore:
+    # the state of the sweeps, one .npz file per job, replaced atomically
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def write(self, key, result, done):
+        arrays = {
+            "F": np.asarray(result.F),
+            "Fsnom": result.Fsnom,
+            "done": done,
+            "time": time.time(),
+        }
+        for name in ("xeq", "xeqbar", "xeqinv"):
+            if getattr(result, name) is not None:
+                arrays[name] = getattr(result, name)
+        self.save(key, arrays)
+
+    def write_failed(self, key, error):
+        # mark job key as failed with the message error
+        self.save(key, {"done": True, "time": time.time(), "error": str(error)})
+
+    def save(self, key, arrays):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(tmp, self.path(key))
+
+    def read(self, key):
+        # the Job of key, or None if there is none
+        try:
+            with np.load(self.path(key), allow_pickle=False) as job:
+                if "error" in job:
+                    return Job(None, True, float(job["time"]), str(job["error"]))
+                result = calc.EquiFluxResult(
+                    *[
+                        job[name] if name in job else None
+                        for name in ("xeq", "xeqbar", "xeqinv")
+                    ],
+                    F=list(job["F"]),
+                    Fsnom=float(job["Fsnom"]),
+                )
+                return Job(result, bool(job["done"]), float(job["time"]))
+        except FileNotFoundError:
+            return None
+
+    def claim(self, key):
+        # True if this process should (re)start job key: the job has not
+        # been started (or its worker died) and no other process claimed it
+        job = self.read(key)
+        if job is not None and (job.done or time.time() - job.time < STALE_AFTER):
+            return False
+        lock = self.path(key) + ".lock"
+        if os.path.exists(lock) and time.time() - os.path.getmtime(lock) > STALE_AFTER:
+            os.remove(lock)
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        self.prune()
+        return True
+
+    def release(self, key):
+        try:
+            os.remove(self.path(key) + ".lock")
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        # remove job files which have not been written for KEEP_FOR
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > KEEP_FOR:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def run_job(store, key, params):
+    # solve the sweep params, publishing its partial results as it goes
+    reported = {}
+    published = [0.0]
+
+    def progress(name, F, states):
+        reported[name] = (F, states)
+        now = time.time()
+        if now - published[0] >= PUBLISH_INTERVAL:
+            published[0] = now
+            passes = params.get("passes", calc.EQUI_PASSES)
+            result = partial_result(params["Fsnom"], passes, reported)
+            store.write(key, result, False)
+
+    try:
+        with metrics.record("equi_flux_job"):
+            metrics.note(**metrics.params_fields(params))
+            try:
+                with metrics.stage("model"):
+                    result = calc.solve_equi_flux(**params, progress=progress)
+            except Exception as error:
+                # recorded, so that the polls report the failure instead of
+                # starting the job again; the traceback goes to the log
+                message = "%s: %s" % (type(error).__name__, error)
+                metrics.note(error=message)
+                store.write_failed(key, message)
+                raise
+            metrics.solved(result)
+        store.write(key, result, True)
+        cache.results.put(key, cache.freeze(result))
+    finally:
+        store.release(key)
+
+
+def solve_equi_flux(store, params):
+    # (result, done) for the sweep params (including the passes to run): the
+    # cached result, the result solved inline for a small sweep, or the
+    # partial result of its job so far (None before the first points are
+    # in). Starts the job in the background if needed, and raises JobFailed
+    # if the sweep failed.
+    key = cache.params_key("equi_flux", params)
+    result = cache.results.get(key)
+    if result is not None:
+        return result, True
+    if params.get("adaptive") or params.get("nt", calc.EQUI_NT) <= INLINE_NT:
+        try:
+            return cache.solve_equi_flux(**params), True
+        except Exception as error:
+            raise JobFailed("%s: %s" % (type(error).__name__, error)) from error
+    job = store.read(key)
+    if job is not None and job.error is not None:
+        raise JobFailed(job.error)
+    if job is not None and job.done:
+        cache.results.put(key, cache.freeze(job.result))
+        return job.result, True
+    if store.claim(key):
+        threading.Thread(target=run_job, args=(store, key, params), daemon=True).start()
+    return (job.result if job is not None else None), False
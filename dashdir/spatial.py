@@ -0,0 +1,195 @@
+# file spatial.py
+
+# Gridded Daisyworld: the planet is a latitude-longitude grid of cells, each
+# with its own daisy areas, albedo and temperatures, stepped with the physics
+# of calculations.py (calc.UpdateTemp, calc.UpdateAlbedo and the masked area
+# update of batch.py work on whole grids unchanged). Two things are added:
+#   * the solar flux depends on latitude (annual mean insolation, see
+#     flux_profile), so the tropics are hot and the poles cold;
+#   * heat diffuses between neighbouring cells: every generation the planet
+#     temperature of the local radiative balance is spread out over a
+#     distance of about `diffusion` degrees, and the daisy temperatures follow
+#     the spread planet temperature (as in calc.UpdateTemp).
+# The grid is periodic in longitude and closed (no flux) at the poles. Cells
+# are treated as flat (no metric terms), which is plenty for a teaching model.
+# The diffusion runs as explicit 5-point stencil steps ("stencil", cheap for
+# short distances, but fine grids need many steps) or exactly in Fourier
+# space ("fft", any distance at the cost of two FFTs); both use the same
+# discrete Laplacian and boundaries. "auto" picks the cheaper one.
+
+from collections import namedtuple
+
+import numpy as np
+
+import batch
+import calculations as calc
+
+DIFFUSION_METHODS = ("auto", "stencil", "fft")
+# "auto" takes the stencil if this many steps per generation are enough
+MAX_STENCIL_STEPS = 2
+
+# result of a gridded run: the final state of every cell (a structured array of
+# shape (nlat, nlon), see calc.state_dtype), the cell centres (degrees) and the
+# area-weighted global mean state of every generation
+SpatialResult = namedtuple(
+    "SpatialResult", ["x", "lat", "lon", "means", "gens", "Fsnom"]
+)
+
+
+def grid_coords(shape):
+    # latitudes and longitudes (degrees) of the centres of a (nlat, nlon) grid
+    nlat, nlon = shape
+    lat = (np.arange(nlat) + 0.5) * 180 / nlat - 90
+    lon = (np.arange(nlon) + 0.5) * 360 / nlon - 180
+    return lat, lon
+
+
+def flux_profile(lat):
+    # annual mean insolation at latitude lat (degrees) relative to the global
+    # mean: 1 - 0.482 P2(sin lat) (North, 1975), which averages to 1 over the
+    # sphere
+    s = np.sin(np.radians(lat))
+    return 1 - 0.482 * (3 * s ** 2 - 1) / 2
+
+
+def diffusion_coefficients(diffusion, shape):
+    # dimensionless diffusivities (cells^2 per generation) along latitude and
+    # longitude that spread heat over an RMS distance of diffusion degrees
+    nlat, nlon = shape
+    k_lat = diffusion ** 2 / 2 / (180 / nlat) ** 2
+    k_lon = diffusion ** 2 / 2 / (360 / nlon) ** 2
+    return k_lat, k_lon
+
+
+def stencil_steps(k_lat, k_lon):
+    # explicit steps needed for stability
+    return int(np.ceil((k_lat + k_lon) / 0.4))
+
+
+def diffuse_stencil(T, k_lat, k_lon):
+    # explicit 5-point steps
+    steps = stencil_steps(k_lat, k_lon)
+    k_lat, k_lon = k_lat / steps, k_lon / steps
+    for _ in range(steps):
+        # neighbours across the poles are the cells themselves (no flux)
+        north = np.concatenate([T[1:], T[-1:]])
+        south = np.concatenate([T[:1], T[:-1]])
+        T = (
+            T
+            + k_lat * (north + south - 2 * T)
+            + k_lon * (np.roll(T, 1, axis=1) + np.roll(T, -1, axis=1) - 2 * T)
+        )
+    return T
+
+
+def diffuse_fft(T, k_lat, k_lon):
+    # exact solution over one generation of the same discrete diffusion: the
+    # grid mirrored at the poles is periodic in both directions, so the
+    # Laplacian is diagonal in Fourier space
+    nlat, nlon = T.shape
+    mirrored = np.concatenate([T, T[::-1]])
+    modes_lat = 2 * np.cos(2 * np.pi * np.fft.fftfreq(2 * nlat)) - 2
+    modes_lon = 2 * np.cos(2 * np.pi * np.fft.rfftfreq(nlon)) - 2
+    decay = np.exp(k_lat * modes_lat[:, None] + k_lon * modes_lon[None, :])
+    return np.fft.irfft2(np.fft.rfft2(mirrored) * decay, s=mirrored.shape)[:nlat]
+
+
+def diffuse(T, diffusion, method="auto"):
+    # spread the field T (nlat, nlon) over an RMS distance of diffusion degrees
+    if method not in DIFFUSION_METHODS:
+        raise ValueError("unknown diffusion method %r" % method)
+    k_lat, k_lon = diffusion_coefficients(diffusion, T.shape)
+    if method == "auto":
+        cheap = stencil_steps(k_lat, k_lon) <= MAX_STENCIL_STEPS
+        method = "stencil" if cheap else "fft"
+    if method == "fft":
+        return diffuse_fft(T, k_lat, k_lon)
+    return diffuse_stencil(T, k_lat, k_lon)
+
+
+def DaisyTemps(x, F, rat, em_p, sig, ins_p, Albedo):
+    # daisy temperatures for the planet temperature x["Tp"], as calc.UpdateTemp
+    Fp = sig * x["Tp"] ** 4
+    Fw = F * (1 - Albedo["w"]) * rat / em_p
+    x["Tw"] = np.sqrt(np.sqrt((ins_p * (Fw - Fp) + Fp) / sig))
+    Fb = F * (1 - Albedo["b"]) * rat / em_p
+    x["Tb"] = np.sqrt(np.sqrt((ins_p * (Fb - Fp) + Fp) / sig))
+    return x
+
+
+def StepGrid(x, F, p, diffusion=0.0, method="auto"):
+    # advance every cell of the grid x (dictionary of arrays) by one
+    # generation in place; F is the flux of every latitude, shape (nlat, 1)
+    args = (p["rat"], p["em_p"], p["sig"], p["ins_p"], p["Albedo"])
+    calc.UpdateTemp(x, F, *args)
+    if diffusion > 0:
+        x["Tp"] = diffuse(x["Tp"], diffusion, method)
+        DaisyTemps(x, F, *args)
+    batch.UpdateAreas(x, p["death"], p["minarea"], p["T_min"], p["T_opt"])
+    calc.UpdateAlbedo(x, p["Albedo"])
+
+
+def global_mean(values, weights):
+    # area-weighted mean of a (nlat, nlon) field; weights per latitude
+    return float(np.dot(weights, values.mean(axis=1)))
+
+
+def solve_spatial(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    diffusion=0.0,
+    shape=(45, 90),
+    ngen=60,
+    areas=None,
+    seed=0,
+    method="auto",
+):
+    # run the gridded model for ngen generations. Every cell starts with the
+    # initial areas scattered randomly (by up to +-100 %, reproducibly for a
+    # given seed), so that neighbouring cells can settle differently.
+    if areas is None:
+        areas = {"w": 0.01, "b": 0.01}  # initial conditions for area
+    p = dict(
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        Albedo=Albedo,
+        death=death,
+        minarea=minarea,
+        T_min=T_min,
+        T_opt=T_opt,
+    )
+    shape = tuple(shape)
+    lat, lon = grid_coords(shape)
+    F = (Fsnom * flux_profile(lat))[:, None]
+    weights = np.cos(np.radians(lat))
+    weights /= weights.sum()
+
+    # initial condition, one array per entry of the state vector
+    rng = np.random.default_rng(seed)
+    x = {}
+    x["Sw"] = areas["w"] * rng.uniform(0, 2, shape)
+    x["Sb"] = areas["b"] * rng.uniform(0, 2, shape)
+    x["Su"] = 1 - x["Sw"] - x["Sb"]
+    calc.UpdateAlbedo(x, Albedo)
+    calc.UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+
+    means = calc.new_states(ngen)
+    for g in range(ngen):
+        if g > 0:
+            StepGrid(x, F, p, diffusion, method)
+        calc.store_state(means, g, {k: global_mean(v, weights) for k, v in x.items()})
+
+    final = calc.new_states(shape)
+    for name in calc.STATE_VARS:
+        final[name] = x[name]
+    return SpatialResult(final, lat, lon, means, list(range(ngen)), Fsnom)
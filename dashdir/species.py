@@ -0,0 +1,278 @@
+# file species.py
+
+# Daisyworld with any number of daisy species. Where calculations.py loops over
+# the two species "w" and "b" by name, here the species parameters (albedo,
+# death rate, T_min, T_opt) are arrays of shape (n,) and the areas and local
+# temperatures of all species are updated in one vector operation each. Every
+# species grows into the barren area of the previous generation, as in
+# calc.UpdateAreas, so the species updates are independent and the order of
+# the species does not matter.
+#
+# With the two species of init_vars.json (see species_params) the results are
+# identical to calculations.py: the same operations are done in the same
+# order, and as_two_species turns the states back into calc.state_dtype
+# arrays.
+
+import numpy as np
+
+import calculations as calc
+
+# the two species of calculations.py, in the order of their arrays here
+TWO_SPECIES = ("w", "b")
+
+# names of the entries of the state vector: the area and the local temperature
+# of every species are arrays of shape (n,)
+STATE_VARS = ("S", "Su", "Ap", "Tp", "T")
+
+
+def state_dtype(n):
+    # a state vector of n species, in storage order (cf. calc.state_dtype)
+    return np.dtype(
+        [
+            ("S", np.float64, (n,)),
+            ("Su", np.float64),
+            ("Ap", np.float64),
+            ("Tp", np.float64),
+            ("T", np.float64, (n,)),
+        ]
+    )
+
+
+def new_states(shape, n):
+    # preallocate a series of state vectors of n species
+    return np.zeros(shape, dtype=state_dtype(n))
+
+
+def store_state(states, i, x):
+    # write the state vector x (a dictionary or a row) into row i of states
+    states[i] = tuple([x[name] for name in STATE_VARS])
+
+
+def as_dict(x):
+    # dictionary copy of a single state vector (e.g. a row of a state array)
+    return {name: np.array(x[name], dtype=np.float64) for name in STATE_VARS}
+
+
+def species_params(
+    Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt, names=None
+):
+    # the parameters of calculations.py (per-species dictionaries, e.g.
+    # init_vars.json) as the parameters of this module: one array per
+    # per-species parameter, in the order of names, and the barren albedo as
+    # Albedo_none
+    if names is None:
+        names = TWO_SPECIES
+
+    def by_species(values):
+        return np.array([values[name] for name in names], dtype=np.float64)
+
+    return dict(
+        Fsnom=Fsnom,
+        Albedo=by_species(Albedo),
+        Albedo_none=Albedo["none"],
+        rat=rat,
+        em_p=em_p,
+        sig=sig,
+        ins_p=ins_p,
+        death=by_species(death),
+        minarea=minarea,
+        T_min=by_species(T_min),
+        T_opt=by_species(T_opt),
+    )
+
+
+def as_two_species(states):
+    # states of the two species (w, b) as a calc.state_dtype array
+    result = calc.new_states(states.shape)
+    result["Sw"], result["Sb"] = states["S"][..., 0], states["S"][..., 1]
+    result["Tw"], result["Tb"] = states["T"][..., 0], states["T"][..., 1]
+    for name in ("Su", "Ap", "Tp"):
+        result[name] = states[name]
+    return result
+
+
+def running_sum(first, rest):
+    # first + rest[0] + rest[1] + ..., added left to right like the chained
+    # sums of calculations.py (np.sum adds pairwise, which rounds differently)
+    return np.add.accumulate(np.concatenate([[first], rest]))[-1]
+
+
+def UpdateAlbedo(x, Albedo, Albedo_none):
+    # weighted sum of the planet cover, barren area first
+    x["Ap"] = running_sum(Albedo_none * x["Su"], Albedo * x["S"])
+    return x
+
+
+def UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo):
+    # outward flux of a planet with the average albedo (assume Black body)
+    Fp = F * (1 - x["Ap"]) * rat / em_p
+
+    # invert Stefan Boltzmann's law
+    x["Tp"] = np.sqrt(np.sqrt((Fp / sig)))
+
+    # now do the same for the regions of every species
+    Fs = F * (1 - Albedo) * rat / em_p
+    x["T"] = np.sqrt(np.sqrt((ins_p * (Fs - Fp) + Fp) / sig))
+    return x
+
+
+def DaisyGrowth(T, T_min, T_opt):
+    # (float_power squares with pow(), like the scalar ** of calculations.py;
+    # ** 2 on an array multiplies, which can differ in the last bit)
+    G = 1 - np.float_power((T - T_opt) / (T_min - T_opt), 2)
+    # set negative values to 0
+    return np.where(G < 0, 0.0, G)
+
+
+# function to update areas based on growth rate and death rate
+def UpdateAreas(x, death, minarea, T_min, T_opt):
+    grwth = DaisyGrowth(x["T"], T_min, T_opt)
+    Ds = x["S"] * (grwth * x["Su"] - death)
+    # the same 2 checks as in calc.UpdateAreas, applied as masks:
+    # (1) areas which have been set to exactly zero stay zero
+    alive = x["S"] > 0
+    area = np.where(alive, x["S"] + Ds, x["S"])
+    # (2) apply the minimum area if the area comes below the threshold
+    x["S"] = np.where(alive & (area < minarea), minarea, area)
+
+    # update barren area (that what is left)
+    x["Su"] = running_sum(1.0, -x["S"])
+
+
+def StepState(
+    x, F, Albedo, Albedo_none, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
+):
+    # advance the state vector x by one generation, in place
+    UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+    UpdateAreas(x, death, minarea, T_min, T_opt)
+    UpdateAlbedo(x, Albedo, Albedo_none)
+
+
+def RelaxState(
+    x,
+    F,
+    Albedo,
+    Albedo_none,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    tol=calc.EQUI_TOL,
+    max_iter=calc.EQUI_MAX_ITER,
+):
+    # calc.RelaxState: step x in place until the planet temperature changes by
+    # at most tol K; returns the generations stepped and the last change
+    params = (Albedo, Albedo_none, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt)
+    dT = 2
+    n = 0
+    temp = x["Tp"]
+    while dT > tol and n < max_iter:
+        StepState(x, F, *params)
+        n += 1
+        dT = abs(temp - x["Tp"])
+        temp = x["Tp"]
+    return n, dT
+
+
+def initial_state(F, Albedo, Albedo_none, rat, em_p, sig, ins_p, areas):
+    # state vector with the initial species areas areas (shape (n,))
+    x = {}
+    x["S"] = np.array(areas, dtype=np.float64)
+    x["Su"] = running_sum(1.0, -x["S"])
+    # note that we also need to initiate the planetary Albedo
+    UpdateAlbedo(x, Albedo, Albedo_none)
+    # and the temperature
+    UpdateTemp(x, F, rat, em_p, sig, ins_p, Albedo)
+    return x
+
+
+def update_constant_flux(
+    Fsnom,
+    Albedo,
+    Albedo_none,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    areas=None,
+    ngen=40,
+):
+    # First experiment: the first ngen generations of n species. The initial
+    # areas default to 0.01 for every species, as in calculations.py.
+    n = len(Albedo)
+    if areas is None:
+        areas = np.full(n, 0.01)
+    F = Fsnom * 1  # solar radiation
+    params = (Albedo, Albedo_none, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt)
+
+    x = initial_state(F, Albedo, Albedo_none, rat, em_p, sig, ins_p, areas)
+    xgens = new_states(ngen, n)
+    store_state(xgens, 0, x)
+    for g in range(1, ngen):
+        StepState(x, F, *params)
+        store_state(xgens, g, x)
+
+    gens = [i for i in range(ngen)]
+
+    return xgens, gens
+
+
+def sweep_flux(x0, F, Fsnom, params):
+    # continuation: relax a copy of x0 through the flux fractions F in turn
+    xs = new_states(len(F) + 1, len(x0["S"]))
+    iterations = np.zeros(len(F) + 1, dtype=int)
+    residuals = np.full(len(F) + 1, np.nan)
+    store_state(xs, 0, x0)
+    x = as_dict(x0)
+    for i, Fr in enumerate(F, 1):
+        iterations[i], residuals[i] = RelaxState(x, Fr * Fsnom, *params)
+        store_state(xs, i, x)
+    return xs, iterations, residuals
+
+
+def solve_equi_flux(
+    Fsnom,
+    Albedo,
+    Albedo_none,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    areas=None,
+    nt=calc.EQUI_NT,
+):
+    # Experiment 2 Planet response to varying solar flux, for n species: the
+    # forward, barren and backward sweeps of calc.solve_equi_flux. The forward
+    # pass starts from the areas areas (0.01 for every species by default).
+    n = len(Albedo)
+    if areas is None:
+        areas = np.full(n, 0.01)
+    params = (Albedo, Albedo_none, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt)
+    F = calc.flux_fractions(nt)
+    F0 = F[0] * Fsnom
+    x0 = initial_state(F0, Albedo, Albedo_none, rat, em_p, sig, ins_p, areas)
+    x0bar = initial_state(F0, Albedo, Albedo_none, rat, em_p, sig, ins_p, np.zeros(n))
+
+    iterations = np.zeros((3, len(F)), dtype=int)
+    residuals = np.full((3, len(F)), np.nan)
+    xeq, iterations[0], residuals[0] = sweep_flux(x0, F[1:], Fsnom, params)
+    xeqbar, iterations[1], residuals[1] = sweep_flux(x0bar, F[1:], Fsnom, params)
+
+    # also run the experiment backwards from the end of the forward run
+    xeqinv, it_inv, res_inv = sweep_flux(xeq[-1], F[::-1], Fsnom, params)
+    xeqinv = xeqinv[::-1][1:]
+    iterations[2], residuals[2] = it_inv[::-1][1:], res_inv[::-1][1:]
+
+    return calc.EquiFluxResult(xeq, xeqbar, xeqinv, F, Fsnom, iterations, residuals)
@@ -0,0 +1,6 @@
+# the modules of dashdir are imported flat (import calculations as calc), as
+# the app does
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,16 @@
+// Runs the Tab 1 callback of assets/daisyworld.js for the slider settings of
+// a golden file (tests/golden/constant_flux.json) and prints the extendData
+// of both figures for every setting as JSON:
+//   node constant_flux.js golden/constant_flux.json
+
+var fs = require("fs");
+var path = require("path");
+var daisyworld = require(path.join(__dirname, "..", "assets", "daisyworld.js"));
+
+var golden = JSON.parse(fs.readFileSync(process.argv[2], "utf8"));
+var results = golden.cases.map(function (c) {
+    return daisyworld.update_tab1(
+        c.Aw, c.Ab, c.An, c.ins_p, c.distance, golden.init_vars
+    );
+});
+process.stdout.write(JSON.stringify(results));
@@ -0,0 +1,116 @@
+# Golden output of the constant flux experiment, shared by calculations.py and
+# its browser port assets/daisyworld.js (Tab 1), so that the two cannot drift
+# apart. The golden file holds the states of every generation for the corners
+# of the Tab 1 slider ranges and the initial settings. After a deliberate
+# change of the model, regenerate it (from dashdir) with
+#   python -m tests.test_constant_flux_golden
+# and change the port to match.
+
+import copy
+import itertools
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import calculations as calc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, "golden", "constant_flux.json")
+
+# the golden states are stored to this many significant digits, enough for
+# the relative tolerance RTOL of the comparisons
+DIGITS = 13
+RTOL = 1e-12
+
+# ranges of the Tab 1 sliders of app.py
+SLIDERS = {
+    "Aw": (0.5, 1),
+    "Ab": (0, 0.5),
+    "An": (0.3, 0.7),
+    "ins_p": (0, 0.5),
+    "distance": (0.8, 1.2),
+}
+
+
+def tab1_params(init_vars, Aw, Ab, An, ins_p, distance):
+    # the parameters of Tab 1 for a setting of its sliders
+    params = copy.deepcopy(init_vars)
+    params["Albedo"] = {"w": Aw, "b": Ab, "none": An}
+    params["ins_p"] = ins_p
+    params["Fsnom"] = calc.update_solar_constant(calc.fromAU(distance))
+    return params
+
+
+def make_golden(init_vars):
+    settings = [
+        dict(zip(SLIDERS, values)) for values in itertools.product(*SLIDERS.values())
+    ]
+    settings.append(
+        {
+            "Aw": init_vars["Albedo"]["w"],
+            "Ab": init_vars["Albedo"]["b"],
+            "An": init_vars["Albedo"]["none"],
+            "ins_p": init_vars["ins_p"],
+            "distance": 1,
+        }
+    )
+    cases = []
+    for setting in settings:
+        result = calc.solve_constant_flux(**tab1_params(init_vars, **setting))
+        xgens = {
+            name: [float("%.*g" % (DIGITS, v)) for v in result.xgens[name]]
+            for name in calc.STATE_VARS
+        }
+        cases.append(dict(setting, xgens=xgens))
+    return {"init_vars": init_vars, "cases": cases}
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with open(GOLDEN) as infile:
+        return json.load(infile)
+
+
+def test_python_matches_golden(golden):
+    for case in golden["cases"]:
+        setting = {name: case[name] for name in SLIDERS}
+        result = calc.solve_constant_flux(**tab1_params(golden["init_vars"], **setting))
+        for name in calc.STATE_VARS:
+            np.testing.assert_allclose(
+                result.xgens[name], case["xgens"][name], rtol=RTOL, err_msg=name
+            )
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_javascript_matches_golden(golden):
+    output = subprocess.run(
+        ["node", os.path.join(HERE, "constant_flux.js"), GOLDEN],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    for case, (temp, area) in zip(golden["cases"], json.loads(output)):
+        xgens = {name: np.array(values) for name, values in case["xgens"].items()}
+        # the traces of update_tab1, as plotting.constant_flux_*_traces
+        expected_temp = [xgens[name] - 273.15 for name in ("Tw", "Tb", "Tp")]
+        expected_area = [100 * xgens[name] for name in ("Sw", "Sb", "Su")]
+        expected_area.append(xgens["Ap"])
+        for expected, update in ((expected_temp, temp), (expected_area, area)):
+            data, indices, npoints = update
+            assert indices == list(range(len(expected)))
+            assert npoints == len(xgens["Sw"])
+            assert data["x"] == [list(range(npoints))] * len(expected)
+            for y, values in zip(expected, data["y"]):
+                np.testing.assert_allclose(values, y, rtol=RTOL, atol=1e-9)
+
+
+if __name__ == "__main__":
+    with open(os.path.join(HERE, "..", "init_vars.json")) as infile:
+        init_vars = json.load(infile)
+    with open(GOLDEN, "w") as outfile:
+        json.dump(make_golden(init_vars), outfile, separators=(",", ":"))
+        outfile.write("\n")
@@ -0,0 +1,39 @@
+# The "steady_state" method of equilibrium.py against plain time-stepping
+# ("fixed_point"): the same sweeps, up to where plain steps stop short of the
+# steady state they approach (a few times EQUI_TOL).
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import calculations as calc
+import equilibrium
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def init_vars():
+    with open(os.path.join(HERE, "..", "init_vars.json")) as infile:
+        return json.load(infile)
+
+
+# (white daisy albedo, black daisy albedo, insulation factor): the defaults,
+# both daisies alike, and the limit cycles of bright white daisies
+@pytest.mark.parametrize(
+    "Aw, Ab, ins_p", [(0.75, 0.25, 0.25), (0.5, 0.5, 0.5), (0.95, 0.25, 0.25)]
+)
+def test_steady_state_matches_fixed_point(init_vars, Aw, Ab, ins_p):
+    params = dict(
+        init_vars, Albedo=dict(init_vars["Albedo"], w=Aw, b=Ab), ins_p=ins_p, nt=50
+    )
+    fixed = calc.solve_equi_flux(**params)
+    steady = calc.solve_equi_flux(
+        **params, solver=equilibrium.EquilibriumSolver("steady_state")
+    )
+    for field in ("xeq", "xeqbar", "xeqinv"):
+        np.testing.assert_allclose(
+            getattr(steady, field)["Tp"], getattr(fixed, field)["Tp"], atol=1.0
+        )
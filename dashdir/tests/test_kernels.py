@@ -0,0 +1,96 @@
+# The fused generation loop of kernels.py against the "python" backend of
+# calc.RelaxState, both as plain Python and compiled with Numba.
+
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import calculations as calc
+import kernels
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (flux fraction, white daisy albedo, tol, max_iter): relaxations to the
+# default tolerance, and runs of a fixed number of generations (tol=0), also
+# on the limit cycle of bright white daisies
+CASES = [
+    (0.7, 0.75, calc.EQUI_TOL, calc.EQUI_MAX_ITER),
+    (1.0, 0.75, calc.EQUI_TOL, calc.EQUI_MAX_ITER),
+    (1.4, 0.75, calc.EQUI_TOL, calc.EQUI_MAX_ITER),
+    (1.0, 0.75, 0.0, 200),
+    (1.0, 0.95, 0.0, 200),
+]
+
+
+@pytest.fixture(scope="module")
+def init_vars():
+    with open(os.path.join(HERE, "..", "init_vars.json")) as infile:
+        return json.load(infile)
+
+
+def relax_python(init_vars, F, Aw, tol, max_iter, monkeypatch):
+    # (state, generations, last change) of calc.RelaxState on the "python"
+    # backend, and the kernel's arguments for the same relaxation
+    monkeypatch.setattr(calc, "BACKEND", "python")
+    params = dict(init_vars, Albedo=dict(init_vars["Albedo"], w=Aw))
+    x = calc.as_dict(calc.solve_constant_flux(**params).xgens[0])
+    state = [x[name] for name in calc.STATE_VARS]
+    args = [
+        params[name]
+        for name in (
+            "rat",
+            "em_p",
+            "sig",
+            "ins_p",
+            "Albedo",
+            "death",
+            "minarea",
+            "T_min",
+            "T_opt",
+        )
+    ]
+    F = F * params["Fsnom"]
+    n, dT = calc.RelaxState(x, F, *args, tol, max_iter)
+    expected = [x[name] for name in calc.STATE_VARS]
+    return expected, n, dT, state, kernels.pack_params(F, *args)
+
+
+@pytest.mark.parametrize("F, Aw, tol, max_iter", CASES)
+def test_uncompiled_kernel(init_vars, F, Aw, tol, max_iter, monkeypatch):
+    expected, n, dT, state, p = relax_python(
+        init_vars, F, Aw, tol, max_iter, monkeypatch
+    )
+    assert kernels.relax_kernel(state, p, tol, max_iter) == (n, dT)
+    assert state == expected
+
+
+@pytest.mark.parametrize("F, Aw, tol, max_iter", CASES)
+def test_compiled_kernel(init_vars, F, Aw, tol, max_iter, monkeypatch):
+    pytest.importorskip("numba")
+    kernel = kernels.compiled_kernel()
+    assert kernel is not None
+    expected, n, dT, state, p = relax_python(
+        init_vars, F, Aw, tol, max_iter, monkeypatch
+    )
+    state = np.array(state)
+    n_compiled, dT_compiled = kernel(state, np.array(p), float(tol), int(max_iter))
+    assert n_compiled == n
+    np.testing.assert_allclose(dT_compiled, dT, rtol=1e-6, atol=1e-12)
+    np.testing.assert_allclose(state, expected, rtol=1e-9)
+
+
+def test_unknown_backend_raises_at_import():
+    env = dict(os.environ, DAISYWORLD_BACKEND="numab")
+    run = subprocess.run(
+        [sys.executable, "-c", "import calculations"],
+        cwd=os.path.join(HERE, ".."),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert run.returncode != 0
+    assert "unknown backend 'numab'" in run.stderr
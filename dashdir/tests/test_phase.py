@@ -0,0 +1,21 @@
+# The tiles of phase.py on disk: only the most recently used diagrams stay.
+
+import os
+
+import numpy as np
+
+import phase
+
+
+def test_tile_store_keeps_recent_diagrams(tmp_path):
+    rows = np.zeros(4, dtype=phase.phase_dtype)
+    for n, key in enumerate("abcde"):
+        store = phase.TileStore(str(tmp_path), key)
+        store.write(0, rows)
+        # last used one second apart, oldest first
+        os.utime(store.directory, (n, n))
+    # opening diagram b makes it the most recently used one
+    store = phase.TileStore(str(tmp_path), "b")
+    store.prune(3)
+    assert sorted(os.listdir(tmp_path)) == ["b", "d", "e"]
+    assert store.read(0) is not None
@@ -0,0 +1,77 @@
+# The sweeps of progressive.py: small ones are solved inline, the partial
+# results of larger ones line up with the finished sweep, and a sweep which
+# raised is reported to the polls, not started again on every poll.
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import cache
+import calculations as calc
+import progressive
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def init_vars():
+    with open(os.path.join(HERE, "..", "init_vars.json")) as infile:
+        return json.load(infile)
+
+
+def test_small_sweep_is_solved_inline(init_vars, tmp_path):
+    cache.results.clear()
+    store = progressive.JobStore(str(tmp_path))
+    params = dict(init_vars, adaptive=True)
+    result, done = progressive.solve_equi_flux(store, params)
+    assert done
+    np.testing.assert_array_equal(
+        result.xeq, calc.solve_equi_flux(**init_vars, adaptive=True).xeq
+    )
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_partial_result_of_all_passes(init_vars, adaptive):
+    reported = {}
+    result = calc.solve_equi_flux(
+        **init_vars,
+        nt=20,
+        adaptive=adaptive,
+        progress=lambda name, F, states: reported.update({name: (F, states)}),
+    )
+    partial = progressive.partial_result(init_vars["Fsnom"], calc.EQUI_PASSES, reported)
+    np.testing.assert_array_equal(partial.F, result.F)
+    for field in ("xeq", "xeqbar", "xeqinv"):
+        np.testing.assert_array_equal(getattr(partial, field), getattr(result, field))
+
+
+def test_failed_job_is_reported_not_restarted(init_vars, tmp_path, monkeypatch):
+    params = dict(init_vars, passes=("forward",), nt=5)
+    monkeypatch.setattr(progressive, "INLINE_NT", 2)
+    calls = []
+
+    def failing_solve(**params):
+        calls.append(threading.current_thread())
+        raise FloatingPointError("overflow")
+
+    monkeypatch.setattr(calc, "solve_equi_flux", failing_solve)
+    # the failing thread's traceback is expected
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    cache.results.clear()
+    store = progressive.JobStore(str(tmp_path))
+
+    deadline = time.time() + 10
+    with pytest.raises(progressive.JobFailed, match="FloatingPointError: overflow"):
+        while time.time() < deadline:
+            result, done = progressive.solve_equi_flux(store, params)
+            assert result is None and not done
+            time.sleep(0.01)
+    for _ in range(3):
+        with pytest.raises(progressive.JobFailed):
+            progressive.solve_equi_flux(store, params)
+    assert len(calls) == 1
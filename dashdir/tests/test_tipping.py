@@ -0,0 +1,48 @@
+# The tipping points of tipping.py as Tab 2 shows them: the summary of a
+# hysteresis loop, and the bisection cached on the parameters of the sweep.
+
+import json
+import os
+
+import pytest
+
+import cache
+import equilibrium
+import tipping
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def init_vars():
+    with open(os.path.join(HERE, "..", "init_vars.json")) as infile:
+        return json.load(infile)
+
+
+def test_loop_is_described_from_low_to_high_flux():
+    before = {"Sw": 0.0, "Sb": 0.0, "Tp": 300.0}
+    after = {"Sw": 0.5, "Sb": 0.0, "Tp": 290.0}
+    # a forward jump below the backward one
+    forward = tipping.TippingPoint("forward", 0.6, 0.6, 0.6, before, after, 1)
+    backward = tipping.TippingPoint("backward", 0.7, 0.7, 0.7, after, before, 1)
+    loop = tipping.Hysteresis(forward, backward, forward.F - backward.F)
+    result = tipping.TippingResult([forward, backward], [loop], 3500.0)
+    assert "the loop between 0.600 and 0.700" in tipping.describe(result)
+
+
+def test_tipping_points_are_cached(init_vars, monkeypatch):
+    options = {"passes": ("forward", "backward"), "nt": 20}
+    result = cache.solve_equi_flux(**init_vars, **options)
+    calls = []
+    find = tipping.find_tipping_points
+
+    def counting_find(**params):
+        calls.append(params)
+        return find(**params)
+
+    monkeypatch.setattr(tipping, "find_tipping_points", counting_find)
+    cache.results.clear()
+    solver = equilibrium.EquilibriumSolver("fixed_point")
+    points = cache.find_tipping_points(result, solver, options, **init_vars)
+    assert cache.find_tipping_points(result, solver, options, **init_vars) is points
+    assert len(calls) == 1
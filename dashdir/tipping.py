@@ -0,0 +1,209 @@
+# file tipping.py
+
+# Tipping points of the varying flux experiment. Where the equilibrium of a
+# flux sweep jumps between neighbouring flux steps (the daisies die off or
+# spring up), the jump is bracketed by the two flux steps and the bracket is
+# bisected: the equilibrium is followed from the near side to the middle of
+# the bracket, and the half in which the jump happens is kept, until the
+# bracket is narrower than xtol. This pins each tipping flux down to xtol in
+# a dozen or so equilibria, where a uniform sweep of the same precision would
+# take some hundred thousand.
+#
+# The forward sweep (increasing flux) and the backward sweep (decreasing flux)
+# tip at different fluxes: the width of each hysteresis loop is the distance
+# between a jump of the forward sweep and the opposite jump of the backward
+# sweep.
+
+from collections import namedtuple
+
+import numpy as np
+
+import calculations as calc
+import equilibrium
+
+# precision of the tipping fluxes (fraction of the nominal flux)
+TIPPING_TOL = 1e-5
+
+# a jump between neighbouring equilibria of a sweep: the planet temperature
+# changes by more than JUMP_DT K, or the daisy areas by more than JUMP_DS in
+# total (the thresholds of calc.adaptive_sweep_flux)
+JUMP_DT = 3.0
+JUMP_DS = 0.08
+
+# a tipping point of the sweep called branch ("forward" or "backward"): F is
+# the tipping flux as a fraction of the nominal flux (the middle of the final
+# bracket, lo on the near and hi on the far side), before and after are the
+# equilibria on either side of the jump (dictionaries) and evaluations the
+# number of equilibria solved for the bisection
+TippingPoint = namedtuple(
+    "TippingPoint", ["branch", "F", "lo", "hi", "before", "after", "evaluations"]
+)
+# a hysteresis loop: a forward and the opposite backward tipping point, width
+# the flux fraction between them
+Hysteresis = namedtuple("Hysteresis", ["forward", "backward", "width"])
+TippingResult = namedtuple("TippingResult", ["points", "hysteresis", "Fsnom"])
+
+
+def jump_size(x, y):
+    # how far apart the equilibria x and y are, in units of a jump (above 1
+    # is a jump)
+    dT = abs(x["Tp"] - y["Tp"]) / JUMP_DT
+    dS = (abs(x["Sw"] - y["Sw"]) + abs(x["Sb"] - y["Sb"])) / JUMP_DS
+    return max(dT, dS)
+
+
+def branch_points(result, branch):
+    # [(flux fraction, equilibrium)] of a sweep of a calc.EquiFluxResult, in
+    # the order the sweep visits them
+    if branch == "forward":
+        return list(zip(result.F, result.xeq))
+    # xeqinv[i] is the equilibrium at F[i + 1], and the last entry is the end
+    # of the forward sweep (see calc.solve_equi_flux)
+    return list(zip(result.F[1:], result.xeqinv[:-1]))[::-1]
+
+
+def find_jumps(points):
+    # indices i where the sweep jumps between points[i] and points[i + 1]
+    return [
+        i
+        for i in range(len(points) - 1)
+        if jump_size(points[i][1], points[i + 1][1]) > 1
+    ]
+
+
+def settle_bracket(relax, params, Fsnom, sweep, i):
+    # the bracket of the jump between sweep[i] and sweep[i + 1]. The sweep
+    # relaxes with a loose tolerance, so next to a tipping point its last
+    # equilibrium before the jump may not have settled yet: the bracket is
+    # moved back as long as its near end, settled with relax, jumps as well.
+    # Returns the bracket and the equilibria at its ends.
+    hi, x_hi = sweep[i + 1][0], calc.as_dict(sweep[i + 1][1])
+    while True:
+        lo, x_lo = sweep[i][0], calc.as_dict(sweep[i][1])
+        x = dict(x_lo)
+        relax(x, lo * Fsnom, *params)
+        if jump_size(x, x_lo) < jump_size(x, x_hi) or i == 0:
+            return lo, x, hi, x_hi
+        hi, x_hi = lo, x
+        i -= 1
+
+
+def bisect_jump(relax, params, Fsnom, lo, x_lo, hi, x_hi, xtol=TIPPING_TOL):
+    # narrow the bracket [lo, hi] (flux fractions, lo on the near side, either
+    # way round) of a jump from the equilibrium x_lo to x_hi (dictionaries)
+    # down to xtol, following the near branch from x_lo. Returns the final
+    # bracket, the equilibria at its ends and the number of equilibria solved.
+    evaluations = 0
+    while abs(hi - lo) > xtol:
+        mid = (lo + hi) / 2
+        x = dict(x_lo)
+        relax(x, mid * Fsnom, *params)
+        evaluations += 1
+        # still on the near branch if closer to it than to the far one
+        if jump_size(x, x_lo) < jump_size(x, x_hi):
+            lo, x_lo = mid, x
+        else:
+            hi, x_hi = mid, x
+    return lo, x_lo, hi, x_hi, evaluations
+
+
+def pair_hysteresis(points):
+    # match every forward tipping point with the nearest backward one which
+    # jumps the other way (the planet temperature changes the other way;
+    # jumps of the areas alone, as with identical daisies, form no loop)
+    forward = [p for p in points if p.branch == "forward"]
+    backward = [p for p in points if p.branch == "backward"]
+    loops = []
+    for p in forward:
+        sign = np.sign(round(p.after["Tp"] - p.before["Tp"], 6))
+        if sign == 0:
+            continue
+        opposite = [
+            q
+            for q in backward
+            if np.sign(round(q.after["Tp"] - q.before["Tp"], 6)) == -sign
+        ]
+        if opposite:
+            q = min(opposite, key=lambda q: abs(q.F - p.F))
+            loops.append(Hysteresis(p, q, p.F - q.F))
+    return loops
+
+
+def find_tipping_points(
+    Fsnom,
+    Albedo,
+    rat,
+    em_p,
+    sig,
+    ins_p,
+    death,
+    minarea,
+    T_min,
+    T_opt,
+    result=None,
+    solver=None,
+    xtol=TIPPING_TOL,
+):
+    # tipping points of the forward and backward sweeps of the varying flux
+    # experiment, bisected to xtol, and the hysteresis loops between them.
+    # result is the calc.EquiFluxResult to start from (with the forward and
+    # backward passes; solved on the default flux grid if None). The bisection
+    # follows the branches with solver (anything with a relax method like
+    # equilibrium.EquilibriumSolver), by default the plain time-stepping
+    # ("fixed_point") the sweeps are solved with, so that the tipping points
+    # mark the jumps of the sweep.
+    params = (rat, em_p, sig, ins_p, Albedo, death, minarea, T_min, T_opt)
+    if result is None:
+        result = calc.solve_equi_flux(
+            Fsnom, Albedo, rat, em_p, sig, ins_p, death, minarea, T_min, T_opt
+        )
+    if solver is None:
+        solver = equilibrium.EquilibriumSolver("fixed_point")
+
+    points = []
+    for branch in ("forward", "backward"):
+        sweep = branch_points(result, branch)
+        brackets = set()
+        for i in find_jumps(sweep):
+            lo, x_lo, hi, x_hi = settle_bracket(solver.relax, params, Fsnom, sweep, i)
+            # several jumps of the sweep can settle back onto the same one
+            if (lo, hi) in brackets:
+                continue
+            brackets.add((lo, hi))
+            lo, x_lo, hi, x_hi, n = bisect_jump(
+                solver.relax, params, Fsnom, lo, x_lo, hi, x_hi, xtol
+            )
+            # a steep but continuous stretch of the sweep narrows down to no
+            # jump at all
+            if jump_size(x_lo, x_hi) > 1:
+                points.append(
+                    TippingPoint(branch, (lo + hi) / 2, lo, hi, x_lo, x_hi, n)
+                )
+
+    return TippingResult(points, pair_hysteresis(points), Fsnom)
+
+
+def describe(result):
+    # Markdown summary of a TippingResult for the students
+    if not result.points:
+        return "No tipping points: the daisies change smoothly with the solar flux."
+
+    def flux(F):
+        return "%.3f times the nominal flux (%.0f W m-2)" % (F, F * result.Fsnom)
+
+    lines = []
+    for p in result.points:
+        way = "increasing" if p.branch == "forward" else "decreasing"
+        grow = p.after["Sw"] + p.after["Sb"] > p.before["Sw"] + p.before["Sb"]
+        what = "spread" if grow else "die off"
+        lines.append("* With %s flux the daisies %s at %s." % (way, what, flux(p.F)))
+    for loop in result.hysteresis:
+        lines.append(
+            "* Hysteresis: the loop between %.3f and %.3f is %s wide."
+            % (
+                min(loop.backward.F, loop.forward.F),
+                max(loop.backward.F, loop.forward.F),
+                flux(abs(loop.width)),
+            )
+        )
+    return "\n".join(lines)